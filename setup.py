@@ -65,6 +65,7 @@ setuptools.setup(
     # install_requires=['Pillow'],
     extras_require={
         'dev': ['check-manifest'],
+        'sparse': ['scipy>=1.9.0'],
     },
     include_package_data=True,
     install_requires=REQUIREMENTS
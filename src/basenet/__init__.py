@@ -22,7 +22,8 @@ from .__special__ import __version__
 from .deeplearning import BaseNetCompiler, BaseNetResults, BaseNetModel, BaseNetFeeder
 from .metaheuristic import BaseNetHeuristic, BaseNetRandomSearch, BaseNetGenetic
 from .supervised import BaseNetLMSE
-from .database import BaseNetDatabase
+from .database import BaseNetDatabase, BaseNetDatabaseView, BaseNetRaggedArray
+from .augmentation import BaseNetAugmentation
 from .stackroom import BaseNetStackRoom
 from .cluster import CassandraCluster
 from .computervision import basenet_cv_gui, BaseNetCVVisualizer
@@ -0,0 +1,125 @@
+# - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
+#                                                           #
+#   This file was created by: Alberto Palomo Alonso         #
+# Universidad de Alcalá - Escuela Politécnica Superior      #
+#                                                           #
+# - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
+"""
+The augmentation.py file contains the BaseNetAugmentation transforms.
+"""
+# Import statements:
+import functools
+import numpy as np
+
+
+# -----------------------------------------------------------
+class BaseNetAugmentation:
+    """
+    The BaseNetAugmentation class gathers vectorized data augmentation transforms for the batches of a
+    BaseNetDatabase. Each transform is applied to a whole batch at once (no loop over the instances) and only exists
+    per batch: the augmented instances are never stored.
+
+        my_database.augment(BaseNetAugmentation.flip(axis=2), BaseNetAugmentation.translate(4))
+
+    A transform is any callable transform(x, y, rng) -> (x, y) taking a batch of decoded inputs, its solutions and a
+    np.random.Generator, so user-defined transforms can be mixed with these ones. The transforms built here can be
+    pickled with the database.
+    """
+    @staticmethod
+    def flip(axis: int = 2, probability: float = 0.5):
+        """
+        This function builds a random flip, i.e. a horizontal flip of (batch, height, width, channels) images.
+        :param axis: The axis of the batch to flip.
+        :param probability: The probability of flipping each instance.
+        :return: The transform.
+        """
+        return functools.partial(_flip, axis=axis, probability=probability)
+
+    @staticmethod
+    def translate(max_shift: int, axes: tuple = (1, 2), fill: float = 0.0):
+        """
+        This function builds a random translation, shifting each instance by up to max_shift positions along each
+        axis. The uncovered positions are filled with a constant.
+        :param max_shift: The maximum shift, in positions.
+        :param axes: The axes of the batch to shift.
+        :param fill: The value of the uncovered positions.
+        :return: The transform.
+        """
+        return functools.partial(_translate, max_shift=max_shift, axes=tuple(axes), fill=fill)
+
+    @staticmethod
+    def noise(std: float):
+        """
+        This function builds an additive gaussian noise.
+        :param std: The standard deviation of the noise.
+        :return: The transform.
+        """
+        return functools.partial(_noise, std=std)
+
+    @staticmethod
+    def brightness(delta: float):
+        """
+        This function builds a random brightness change: a uniform offset in [-delta, delta] per instance.
+        :param delta: The maximum offset.
+        :return: The transform.
+        """
+        return functools.partial(_brightness, delta=delta)
+
+    @staticmethod
+    def mixup(alpha: float = 0.2):
+        """
+        This function builds a mixup: each instance (and its solution) is mixed with another instance of the batch
+        with a Beta(alpha, alpha) weight. The solutions must be one-hot vectors or continuous values.
+        :param alpha: The parameter of the Beta distribution.
+        :return: The transform.
+        """
+        return functools.partial(_mixup, alpha=alpha)
+
+
+def _per_instance(values: np.ndarray, ndim: int) -> np.ndarray:
+    # This function reshapes one value per instance to broadcast along the batch.
+    return values.reshape((-1,) + (1,) * (ndim - 1))
+
+
+def _flip(x: np.ndarray, y: np.ndarray, rng: np.random.Generator, axis: int, probability: float) -> tuple:
+    flipped = rng.random(len(x)) < probability
+    return np.where(_per_instance(flipped, x.ndim), np.flip(x, axis=axis), x), y
+
+
+def _translate(x: np.ndarray, y: np.ndarray, rng: np.random.Generator, max_shift: int, axes: tuple,
+               fill: float) -> tuple:
+    for axis in axes:
+        length = x.shape[axis]
+        shifts = rng.integers(-max_shift, max_shift + 1, size=len(x))
+        # Source position of every output position, per instance, broadcast along the other axes:
+        source = np.arange(length)[None, :] - shifts[:, None]
+        shape = [1] * x.ndim
+        shape[0], shape[axis] = len(x), length
+        source = source.reshape(shape)
+        valid = (source >= 0) & (source < length)
+        shifted = np.take_along_axis(x, np.broadcast_to(np.clip(source, 0, length - 1),
+                                                        x.shape[:axis] + (length,) + x.shape[axis + 1:]), axis=axis)
+        x = np.where(valid, shifted, np.asarray(fill, dtype=x.dtype))
+    return x, y
+
+
+def _noise(x: np.ndarray, y: np.ndarray, rng: np.random.Generator, std: float) -> tuple:
+    return x + rng.normal(0.0, std, size=x.shape).astype(x.dtype, copy=False), y
+
+
+def _brightness(x: np.ndarray, y: np.ndarray, rng: np.random.Generator, delta: float) -> tuple:
+    offsets = rng.uniform(-delta, delta, size=len(x)).astype(x.dtype, copy=False)
+    return x + _per_instance(offsets, x.ndim), y
+
+
+def _mixup(x: np.ndarray, y: np.ndarray, rng: np.random.Generator, alpha: float) -> tuple:
+    weights = rng.beta(alpha, alpha, size=len(x))
+    partners = rng.permutation(len(x))
+    wx = _per_instance(weights, x.ndim).astype(x.dtype, copy=False)
+    wy = _per_instance(weights, y.ndim)
+    _y = y.astype(np.result_type(y.dtype, np.float32), copy=False)
+    mixed_y = (wy * _y + (1 - wy) * _y[partners]).astype(_y.dtype, copy=False)
+    return wx * x + (1 - wx) * x[partners], mixed_y
+# - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
+#                        END OF FILE                        #
+# - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
@@ -10,14 +10,37 @@ The database.py file contains the BaseNetDatabase class.
 # Import statements:
 import tensorflow as tf
 import logging
-import random
 import numpy as np
+import os
 import pickle
+import struct
+import json
+import zlib
+import hashlib
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
 import copy
 import pandas as pd
+try:
+    from scipy import sparse as scipy_sparse
+except ImportError:
+    scipy_sparse = None
 
 from .__special__ import __version__
 
+__array_names__ = ('xtrain', 'ytrain', 'xval', 'yval', 'xtest', 'ytest')
+__magic__ = b'BNDB'
+__format_version__ = 1
+__preamble__ = struct.Struct('<4sHHQ')   # Magic, format version, reserved, header length.
+__data_alignment__ = 4096
+__block_alignment__ = 64
+__checksum_chunk__ = 1 << 24
+__compressed_parts__ = {'csr': ('data', 'indices', 'indptr'), 'ragged': ('values', 'offsets')}
+__statistics_parts__ = ('mean', 'm2', 'min', 'max')
+__normalization_parts__ = ('shift', 'scale')
+
 
 # -----------------------------------------------------------
 class BaseNetDatabase:
@@ -37,11 +60,48 @@ class BaseNetDatabase:
         *   distribution: Train, validation and test distribution of the input database.
         *   batch_size: Current batch size of the database.
         *   size: The size of the database (train, validation , test).
+        *   seed: Seed (or np.random.Generator) used to split the database.
+        *   n_classes: Number of classes (columns) of the labels, None for single-output regression.
+        *   sparse_labels: If True, categorical labels are stored as class indices instead of one-hot vectors.
+        *   rescale: Rescale factor still to be applied to the inputs. It is 1 unless the database is compact.
+        *   normalization: Per-feature normalization still to be applied to the inputs (see normalize()), or None.
+
+    A compact BaseNetDatabase keeps the inputs (x) in their native data type (i.e. uint8 images) and stores the
+    rescale factor; the division and the cast to dtype[0] are done per batch with the decode() method (the batch
+    iterators and BaseNetModel.fit already do it).
+
+    Every BaseNetDatabase has a content fingerprint (see fingerprint()) that is computed once, saved with the database
+    and discarded when the database changes. Equality is decided with it, and it can be used as a cache key.
+
+    The statistics of each dataset (see statistics()) are computed in one chunked pass, cached and saved with the
+    database. Merging and appending update them without scanning the arrays again.
+
+    The inputs (x) can be a scipy.sparse matrix: they are stored as CSR matrices (split, merged, appended, iterated in
+    sparse batches and saved as such), so the memory scales with the non-zero values instead of the dense shape.
+
+    Variable-length sequences (ragged=True) are stored as a BaseNetRaggedArray: the steps of all the sequences in one
+    flat array plus the offset of each sequence. The batches are padded to their own longest sequence, and the
+    buckets() sampler groups sequences of similar length in the same batches.
 
-    The BaseNetDatabase can be loaded and saved with its own methods.
+    A per-feature normalization (standardization or min-max scaling) can be declared with normalize(): its parameters
+    are computed once from the cached statistics and saved with the database, and it is applied to each batch together
+    with the rescale, so the stored inputs are never normalized (nor copied).
+
+    An augmentation stage can be attached with augment(): its vectorized transforms are applied to each train batch
+    in the threads of the batch iterator (and of BaseNetModel.fit), so the augmented instances are never stored.
+
+    Merging BaseNetDatabases does not copy the arrays: the merged database keeps a list of segments per array and
+    joins them once, the first time the contiguous array is accessed (or when consolidate() is called).
+
+    The BaseNetDatabase can be loaded and saved with its own methods. The saved file is a container with a small
+    metadata header followed by one raw block per array, so it can be loaded as memory-mapped arrays.
     """
+    _cache_statistics = True
+
     def __init__(self, x, y=None, distribution: dict = None, name='unnamed_database', batch_size: int = None,
-                 rescale: float = 1.0, dtype: tuple[str, str] = ('float', 'float'), bits: tuple[int, int] = (32, 32)):
+                 rescale: float = 1.0, dtype: tuple[str, str] = ('float', 'float'), bits: tuple[int, int] = (32, 32),
+                 seed: (int, np.random.Generator, None) = None, sparse_labels: bool = False, compact: bool = False,
+                 stratify=None, ragged: bool = False):
         """
         This class builds a BaseNetDatabase, compatible with the NetBase API.
         :param x: Inputs of the dataset.
@@ -52,8 +112,20 @@ class BaseNetDatabase:
         :param rescale: Rescale factor, all the values in x are divided by this factor, in case rescale is needed.
         :param dtype: Data type of the dataset. ('input', 'output') (x, y)
         :param bits: Bits used for the data type. ('input', 'output') (x, y)
+        :param seed: Seed or np.random.Generator for the train, validation and test split. Random if not provided.
+        :param sparse_labels: Keeps integer labels as class indices instead of encoding them as one-hot vectors.
+        :param compact: Keeps x in its native data type and defers the rescale and the cast to the batches.
+        :param stratify: If True, the split keeps the class proportions of y (argmax of one-hot labels) in the train,
+        validation and test datasets; continuous labels cannot be stratified (the database is not valid). An array with
+        one group key per instance can be given to stratify by it instead. The sizes of the datasets are the same as
+        without stratification.
+        :param ragged: If True, x is a sequence of variable-length sequences, stored without padding.
         """
         self.__version__ = __version__
+        self.n_classes = None
+        self.sparse_labels = sparse_labels
+        self.rescale = rescale if compact else 1.0
+        self.normalization = None
         try:
             if y is None or isinstance(y, (str, tuple)):
                 x_, y_ = self._framework_convertion(x, y)
@@ -67,42 +139,54 @@ class BaseNetDatabase:
 
             self.name: str = name
             self.distribution = _distribution
+            self.seed = seed
 
-            if isinstance(y_, np.ndarray):
-                _y = copy.copy(y_).tolist()
+            self.dtype = (f'{dtype[0]}{bits[0]}', f'{dtype[1]}{bits[1]}')
+            _y = np.asarray(y_)
+            if _y.size:
+                _y, self.n_classes = self._to_binary(_y, self.dtype[1], sparse_labels)
             else:
-                _y = copy.copy(y_)
-
-            if _y:
-                _y = self._to_binary(_y)
+                _y = np.empty((0,), dtype=self.dtype[1])
+            if ragged:
+                _x = BaseNetRaggedArray.from_sequences(x_, None if compact else self.dtype[0])
+                if not compact and rescale != 1:
+                    np.divide(_x.values, rescale, out=_x.values, casting='unsafe')
+            elif _issparse(x_):
+                _x = self._sparse_inputs(x_, 1.0 if compact else rescale, None if compact else self.dtype[0])
+            elif compact:
+                _x = np.asarray(x_)
             else:
-                _y = list()
-            _x = self._rescale(copy.copy(x_), rescale)
+                _x = np.asarray(self._rescale(x_, rescale), dtype=self.dtype[0])
 
-            if len(_x) != len(_y):
+            if _x.shape[0] != len(_y):
                 logging.error('BaseNetDatabase: Error while building the database, the number of instances of '
-                              f'x and y must be the same. Found x: {len(_x)} != y: {len(_y)}.')
+                              f'x and y must be the same. Found x: {_x.shape[0]} != y: {len(_y)}.')
                 self.is_valid = False
                 return
 
-            (xtrain, ytrain), (xtest, ytest), (xval, yval) = self._splitdb((_x, _y), _distribution)
+            if stratify is None or stratify is False:
+                strata = None
+            elif stratify is True:
+                strata = self._strata(_y)
+            else:
+                strata = np.unique(np.asarray(stratify).reshape(_x.shape[0], -1), axis=0, return_inverse=True)[1]
+            (xtrain, ytrain), (xtest, ytest), (xval, yval) = self._splitdb((_x, _y), _distribution, seed, strata)
 
-            self.dtype = (f'{dtype[0]}{bits[0]}', f'{dtype[1]}{bits[1]}')
-            self.xtrain = np.array(xtrain, dtype=self.dtype[0])
-            self.ytrain = np.array(ytrain, dtype=self.dtype[1])
-            self.xval = np.array(xval, dtype=self.dtype[0])
-            self.yval = np.array(yval, dtype=self.dtype[1])
-            self.xtest = np.array(xtest, dtype=self.dtype[0])
-            self.ytest = np.array(ytest, dtype=self.dtype[1])
-
-            self.size = (len(self.xtrain), len(self.xval), len(self.xtest))
+            self.xtrain = xtrain
+            self.ytrain = ytrain
+            self.xval = xval
+            self.yval = yval
+            self.xtest = xtest
+            self.ytest = ytest
+
+            self.size = (self.xtrain.shape[0], self.xval.shape[0], self.xtest.shape[0])
             self.shape = (self.xtrain.shape[1:], self.ytrain.shape[1:])
             self.mapping: tuple[(None, tuple, list), bool] = (None, False)
 
             if batch_size is None:
                 self.batch_size = 1
-                if len(xtrain) > 0:
-                    self.batch_size = 2 ** round(np.log2(len(xtrain) / 256))
+                if xtrain.shape[0] > 0:
+                    self.batch_size = 2 ** round(np.log2(xtrain.shape[0] / 256))
                 if self.batch_size < 1:
                     self.batch_size = 1
             else:
@@ -120,44 +204,212 @@ class BaseNetDatabase:
             logging.error(f'BaseNetDatabase: Error while building the database, raised the following exception: {ex}')
 
     @staticmethod
-    def load(path: str):
+    def load(path: str, mmap: bool = False):
         """
         This function loads the BaseNetDatabase from any path.
         :param path: Path where the BaseNetDatabase is being saved in the file system.
+        :param mmap: If True, the arrays are returned as read-only np.memmap views of the file and their pages are
+        read on demand. Ignored for databases saved with the legacy (pickled) format.
         :return: The loaded database if successful. 'None' if not.
         """
         try:
             if path:
                 with open(path, 'rb') as file:
-                    self = pickle.load(file)
-                if hasattr(self, '__version__'):
-                    if __version__ == self.__version__:
-                        return self
-                return BaseNetDatabase._reversion(self)
+                    header = BaseNetDatabase._read_header(file)
+                    if header is None:
+                        file.seek(0)
+                        self = pickle.load(file)
+                        if hasattr(self, '__version__'):
+                            if __version__ == self.__version__:
+                                return self
+                        return BaseNetDatabase._reversion(self)
+                    arrays = dict()
+                    for array_name, block in header['arrays'].items():
+                        arrays[array_name] = BaseNetDatabase._read_array(file, path, block, header['data_offset'],
+                                                                         mmap)
+                    BaseNetDatabase._read_vectors(file, path, header)
+                return BaseNetDatabase._from_header(header, arrays)
             else:
                 return None
         except Exception as ex:
             logging.error(f'BaseNetDatabase: Failed to load {path}: {ex}')
             return None
 
-    def save(self, path: str):
+    @staticmethod
+    def load_many(paths, workers: int = None):
+        """
+        This function loads many saved BaseNetDatabases in parallel and merges them (in order) into a single
+        BaseNetDatabase, as my_first + my_second + ... would do. The sizes are read from the headers first, so the
+        merged arrays are preallocated once in a shared memory block; each process of the pool reads the blocks of one
+        file directly into its place of the shared block, so the arrays are neither pickled nor copied again.
+        Legacy (pickled) databases are loaded by the pool as well, but are sent back pickled.
+        :param paths: The paths of the saved BaseNetDatabases.
+        :param workers: Number of processes. The default is the number of CPUs.
+        :return: The merged database if successful. 'None' if not.
+        """
+        try:
+            paths = list(paths)
+            if not paths:
+                logging.error('BaseNetDatabase: No paths were given to load.')
+                return None
+            headers = list()
+            for path in paths:
+                with open(path, 'rb') as file:
+                    headers.append(BaseNetDatabase._read_header(file))
+                    if headers[-1] is not None:
+                        BaseNetDatabase._read_vectors(file, path, headers[-1])
+            loaded = dict()
+            if any(header is None for header in headers):
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    legacy = {number: executor.submit(BaseNetDatabase.load, path) for number, (path, header) in
+                              enumerate(zip(paths, headers)) if header is None}
+                    for number, future in legacy.items():
+                        loaded[number] = future.result()
+                        if loaded[number] is None:
+                            return None
+                        headers[number] = loaded[number]._header()
+                        headers[number]['statistics'] = {split: running.to_dict() for split, running in
+                                                         loaded[number].__dict__.get('_statistics', dict()).items()}
+                        headers[number]['normalization'] = getattr(loaded[number], 'normalization', None)
+                        for array_name in __array_names__:
+                            pieces = loaded[number]._pieces(array_name)
+                            headers[number]['arrays'][array_name] = {
+                                'dtype': np.result_type(*pieces).str,
+                                'shape': [sum(piece.shape[0] for piece in pieces)] + list(pieces[0].shape[1:])}
+            layout = BaseNetDatabase._shared_layout(paths, headers)
+
+            # The shared block is created before the pool, so the processes share its resource tracker:
+            arena = _SharedArena(create=True, size=max(layout['nbytes'], 1))
+            try:
+                arrays = dict()
+                for array_name, (offset, dtype, shape) in layout['arrays'].items():
+                    arrays[array_name] = np.frombuffer(arena.buf, dtype=dtype, count=int(np.prod(shape)),
+                                                       offset=offset).reshape(shape)
+                for number, database in loaded.items():
+                    for array_name, (_, _, _, start, stop) in layout['jobs'][number].items():
+                        arrays[array_name][start:stop] = getattr(database, array_name)
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    jobs = [executor.submit(_read_into, path, arena.name, layout['jobs'][number], layout['arrays'])
+                            for number, path in enumerate(paths) if number not in loaded]
+                    for job in jobs:
+                        job.result()
+            finally:
+                arena.unlink()
+
+            header = dict(headers[0])
+            header['size'] = [len(arrays['xtrain']), len(arrays['xval']), len(arrays['xtest'])]
+            header['distribution'] = [size / max(sum(header['size']), 1) for size in header['size']]
+            header['fingerprint'] = None
+            statistics = [_header.get('statistics', dict()) for _header in headers]
+            header['statistics'] = {split: BaseNetDatabase._merged_statistics(statistics, split) for split in
+                                    statistics[0] if all(split in _statistics for _statistics in statistics)}
+            database = BaseNetDatabase._from_header(header, arrays)
+            database.__dict__['_arena'] = arena
+            return database
+        except Exception as ex:
+            logging.error(f'BaseNetDatabase: Failed to load {paths}: {ex}')
+            return None
+
+    def save(self, path: str, legacy: bool = False):
         """
         This function saves the BaseNetDatabase in any format.
         :param path: Path where the BaseNetDatabase is being saved in the file system.
+        :param legacy: If True, the database is pickled as in previous versions instead of using the container format.
         :return: True if the saving was successful. False if not.
         """
         try:
             if path:
-                with open(path, 'wb') as file:
-                    pickle.dump(self, file)
+                # The file is written aside and replaces the previous one only when complete.
+                with open(f'{path}.tmp', 'wb') as file:
+                    if legacy:
+                        pickle.dump(self, file)
+                    else:
+                        self._write_container(file)
+                os.replace(f'{path}.tmp', path)
                 return True
             else:
                 logging.warning(f'BaseNetDatabase: Failed to save {path}: the path does not exist.')
                 return False
         except Exception as ex:
+            if path and os.path.exists(f'{path}.tmp'):
+                os.remove(f'{path}.tmp')
             logging.error(f'BaseNetDatabase: Failed to save {path}: {ex}')
             return False
 
+    def saved_size(self) -> int:
+        """
+        This method computes the size in bytes of the file that save() would write now, without writing it nor reading
+        the arrays: the aligned blocks follow from the shapes and data types of the arrays (and of the cached statistics
+        and normalization, that are saved too) and the header is encoded with the widest checksum and fingerprint.
+        It can be larger than the file by one alignment step (4096 bytes) when the actual header is shorter. Anything
+        that changes the saved state afterwards (i.e. computing statistics or renaming) changes the size as well.
+        :return: The size of the saved file, in bytes.
+        """
+        header, _, length = self._layout()
+        header['checksum'] = 0xFFFFFFFF
+        header['fingerprint'] = '0' * 32
+        return self._data_offset(header) + length
+
+    @staticmethod
+    def inspect(path: str) -> (dict, None):
+        """
+        This function reads the metadata of a saved BaseNetDatabase without loading its arrays. Only the header of the
+        file is read, so it is suitable for catalogs and large StackRooms.
+        :param path: Path where the BaseNetDatabase is saved in the file system.
+        :return: A dictionary with the 'name', 'size', 'shape', 'dtype', 'distribution', 'batch_size', 'mapping',
+        'version', 'checksum' and 'arrays' of the database; or None if it cannot be read. Legacy (pickled) databases
+        are fully loaded to build the metadata and have no checksum.
+        """
+        try:
+            with open(path, 'rb') as file:
+                header = BaseNetDatabase._read_header(file)
+            if header is None:
+                logging.warning(f'BaseNetDatabase: {path} is a legacy database, it must be loaded to be inspected.')
+                database = BaseNetDatabase.load(path)
+                if database is None:
+                    return None
+                header = database._header()
+                header['checksum'] = None
+            header['size'] = tuple(header['size'])
+            header['shape'] = (tuple(header['shape'][0]), tuple(header['shape'][1]))
+            header['dtype'] = tuple(header['dtype'])
+            header['distribution'] = tuple(header['distribution'])
+            header['mapping'] = BaseNetDatabase._decode_mapping(header['mapping'])
+            header.pop('data_offset', None)
+            return header
+        except Exception as ex:
+            logging.error(f'BaseNetDatabase: Failed to inspect {path}: {ex}')
+            return None
+
+    @staticmethod
+    def verify(path: str) -> bool:
+        """
+        This function checks the integrity of a saved BaseNetDatabase against the checksums of its header. The blocks
+        are streamed in chunks, the database is not built in memory.
+        :param path: Path where the BaseNetDatabase is saved in the file system.
+        :return: True if every block matches its checksum. False if not, or if the file is not a container.
+        """
+        try:
+            with open(path, 'rb') as file:
+                header = BaseNetDatabase._read_header(file)
+                if header is None:
+                    logging.warning(f'BaseNetDatabase: {path} is a legacy database without checksum.')
+                    return False
+                checksum = 0
+                for block in BaseNetDatabase._blocks(header):
+                    remaining = np.dtype(block['dtype']).itemsize * int(np.prod(block['shape']))
+                    file.seek(header['data_offset'] + block['offset'])
+                    while remaining > 0:
+                        chunk = file.read(min(remaining, __checksum_chunk__))
+                        if not chunk:
+                            return False
+                        checksum = zlib.crc32(chunk, checksum)
+                        remaining -= len(chunk)
+            return checksum == header['checksum']
+        except Exception as ex:
+            logging.error(f'BaseNetDatabase: Failed to verify {path}: {ex}')
+            return False
+
     def split(self, other):
         """
         The split function of the BaseNetDatabase divides a BaseNetDatabase in n parts.
@@ -189,13 +441,18 @@ class BaseNetDatabase:
 
     def merge(self, other):
         """
-        The merge function of the BaseNetDatabase Class merges two BaseNetDatabases.
+        The merge function of the BaseNetDatabase Class merges two BaseNetDatabases. Only references to the arrays
+        of both databases are kept; they are joined lazily when a contiguous array is needed. Compact databases with
+        different rescale factors cannot be merged, a ValueError is raised.
         :param other: A BaseNetDatabase object to merge.
         :return: A merged BaseNetDatabase.
         """
         if isinstance(other, BaseNetDatabase):
             self._check_validation()
             other._check_validation()
+            if getattr(self, 'rescale', 1.0) != getattr(other, 'rescale', 1.0):
+                raise ValueError(f'BaseNetDatabase: Cannot merge compact databases with different rescale factors '
+                                 f'({getattr(self, "rescale", 1.0)} != {getattr(other, "rescale", 1.0)}).')
             if other:
                 if self.is_valid:
                     try:
@@ -217,6 +474,382 @@ class BaseNetDatabase:
                           f'Expecting type "BaseNetDatabase", given {type(other)}.')
             return self
 
+    def consolidate(self):
+        """
+        This method joins the pending segments of a merged BaseNetDatabase into contiguous arrays.
+        :return: Self object.
+        """
+        for array_name in __array_names__:
+            getattr(self, array_name)
+        return self
+
+    def append(self, x, y, split: str = None, rescale: float = 1.0, seed: (int, np.random.Generator, None) = None):
+        """
+        This method appends a batch of instances to the BaseNetDatabase in place, i.e. for online data collection.
+        The arrays are backed by buffers that double their capacity when they are full, so appending costs O(batch)
+        amortized time and the existing instances are neither re-split, re-encoded nor copied on every call.
+        :param x: Inputs of the batch.
+        :param y: Solutions of the batch. Integer labels are encoded as the labels of the database.
+        :param split: The dataset that receives the batch: 'train', 'val' or 'test'. If None, the instances are routed
+        randomly to keep the distribution of the database.
+        :param rescale: Rescale factor of the batch. Compact databases apply their own factor when decoding.
+        :param seed: Seed or np.random.Generator used to route the instances.
+        :return: Self object.
+        """
+        if isinstance(self._pieces('xtrain')[0], BaseNetRaggedArray) and not isinstance(x, BaseNetRaggedArray):
+            x = BaseNetRaggedArray.from_sequences(x)
+        elif _issparse(x):
+            x = scipy_sparse.csr_matrix(x)
+        elif not isinstance(x, BaseNetRaggedArray):
+            x = np.asarray(x)
+        y = np.asarray(y)
+        if x.shape[0] != len(y):
+            raise ValueError(f'BaseNetDatabase: The number of instances of x and y must be the same. '
+                             f'Found x: {x.shape[0]} != y: {len(y)}.')
+        if split is not None and split not in ('train', 'val', 'test'):
+            raise ValueError(f'BaseNetDatabase: Unknown split "{split}", expecting "train", "val" or "test".')
+        if rescale != 1 and getattr(self, 'rescale', 1.0) == 1:
+            x = BaseNetRaggedArray(x.values / rescale, x.offsets) if isinstance(x, BaseNetRaggedArray) else x / rescale
+        y = self._encode_appended(y)
+        if split is None:
+            distribution = np.asarray(self.distribution, dtype=float)
+            distribution = tuple(100 * distribution / distribution.sum())
+            routes = self._route(self.size, x.shape[0], distribution, np.random.default_rng(seed))
+        else:
+            routes = np.full(x.shape[0], ('train', 'val', 'test').index(split), dtype=np.int8)
+        statistics = self.__dict__.get('_statistics', dict())
+        for number, name in enumerate(('train', 'val', 'test')):
+            selected = routes == number
+            if selected.all():
+                xsel, ysel = x, y
+            elif selected.any():
+                selected = np.flatnonzero(selected)
+                xsel, ysel = x[selected], y[selected]
+            else:
+                continue
+            self._extend(f'x{name}', xsel)
+            self._extend(f'y{name}', ysel)
+            if name in statistics:
+                statistics = dict(statistics)
+                statistics[name] = statistics[name].merge(
+                    self._new_statistics().update(self.decode(xsel, normalize=False), ysel))
+        if statistics:
+            self.__dict__['_statistics'] = statistics
+        self.size = (self._length('xtrain'), self._length('xval'), self._length('xtest'))
+        if split is not None:
+            self.distribution = tuple(100 * _ / sum(self.size) for _ in self.size)
+        if not self.shape[0] and not self.shape[1]:
+            self.shape = (x.shape[1:], y.shape[1:])
+        self._check_validation()
+        return self
+
+    def statistics(self, split: str = 'train', chunk_rows: int = 65_536) -> dict:
+        """
+        This method returns the statistics of one dataset of the BaseNetDatabase, computed in a single chunked pass
+        (Welford / Chan updates) and cached:
+
+            *   count: Number of instances.
+            *   mean, variance, std, min, max: Per-feature statistics of the (decoded and flattened) inputs.
+            *   class_count: Number of instances per class for categorical labels, or the sum of each output.
+            *   balance: Percentage of instances per class, or the mean of each output in percentage.
+
+        :param split: The dataset: 'train', 'val' or 'test'.
+        :param chunk_rows: Number of rows read per chunk when the statistics are computed.
+        :return: A dictionary with the statistics as np.ndarrays.
+        """
+        if split not in ('train', 'val', 'test'):
+            raise ValueError(f'BaseNetDatabase: Unknown split "{split}", expecting "train", "val" or "test".')
+        cache = self.__dict__.get('_statistics', dict())
+        if split not in cache:
+            running = self._new_statistics()
+            for start in range(0, self._length(f'x{split}'), chunk_rows):
+                running.update(self.decode(self._rows(f'x{split}', start, start + chunk_rows), normalize=False),
+                               self._rows(f'y{split}', start, start + chunk_rows))
+            cache = dict(cache)
+            cache[split] = running
+            if self._cache_statistics:
+                self.__dict__['_statistics'] = cache
+        return cache[split].report()
+
+    def fingerprint(self) -> str:
+        """
+        This method returns the content fingerprint of the BaseNetDatabase: a BLAKE2 hash over the bytes, shapes and
+        data types of its arrays, its mapping and its rescale factor. It is computed once and cached (and stored when
+        the database is saved); any change on the arrays or the mapping discards it. Two databases with the same
+        fingerprint hold the same data, so it can be used as a key for caches of models, weights or outputs.
+        :return: The fingerprint as a hexadecimal string.
+        """
+        if self.__dict__.get('_fingerprint') is None:
+            self.__dict__['_fingerprint'] = self._content_hash()
+        return self.__dict__['_fingerprint']
+
+    def decode(self, x: np.ndarray, normalize: bool = True) -> np.ndarray:
+        """
+        This method converts inputs stored by this database into the model inputs: cast to dtype[0], divided by the
+        rescale factor and normalized (see normalize()). It returns the same array for non-compact databases without
+        normalization.
+        :param x: A batch of inputs from this database, i.e. my_database.xtrain[:32].
+        :param normalize: If False, the normalization is not applied.
+        :return: The decoded batch.
+        """
+        return _decode(x, self.dtype[0], getattr(self, 'rescale', 1.0),
+                       getattr(self, 'normalization', None) if normalize else None)
+
+    def batches(self, split: str = 'train', batch_size: int = None, shuffle: bool = True,
+                seed: (int, np.random.Generator, None) = None, prefetch: int = 2, workers: int = 1,
+                drop_last: bool = False, sampler=None, augment: bool = None):
+        """
+        This method iterates over one dataset of the BaseNetDatabase in (x, y) batches of NumPy arrays. The batches
+        are gathered by index (across merged segments, views and memory-mapped files) and decoded in a background
+        thread pool, so reading and decoding the next batches overlaps with the computation on the current one.
+
+            for xbatch, ybatch in my_database.batches('train', shuffle=True, seed=0, prefetch=4, workers=2):
+                ...
+
+        :param split: The dataset to iterate: 'train', 'val' or 'test'.
+        :param batch_size: The batch size. The default is the batch_size of the database.
+        :param shuffle: If True, the order of the instances is shuffled.
+        :param seed: Seed or np.random.Generator used to shuffle and augment.
+        :param prefetch: Number of batches prepared in advance. 0 gathers each batch when it is requested.
+        :param workers: Number of threads gathering batches.
+        :param drop_last: If True, the last batch is dropped when it is smaller than the batch size.
+        :param sampler: A sampler built with the sampler() method. If given, it draws the indices of each batch (one
+        epoch) and the split, batch_size, shuffle and drop_last parameters are ignored.
+        :param augment: If True, the transforms attached with augment() are applied to the batches. The default
+        applies them to the train dataset only.
+        :return: A generator of (x, y) tuples.
+        """
+        # The order and the augmentation seeds are drawn from independent streams of the seed:
+        entropy = seed.integers(1 << 63) if isinstance(seed, np.random.Generator) else seed
+        order_rng, seeds = (np.random.default_rng(stream) for stream in np.random.SeedSequence(entropy).spawn(2))
+        if sampler is not None:
+            split = sampler.split
+            indices = iter(sampler)
+        elif split not in ('train', 'val', 'test'):
+            raise ValueError(f'BaseNetDatabase: Unknown split "{split}", expecting "train", "val" or "test".')
+        else:
+            batch_size = self.batch_size if batch_size is None else batch_size
+            length = self._length(f'x{split}')
+            order = order_rng.permutation(length) if shuffle else np.arange(length)
+            stop = length - length % batch_size if drop_last else length
+            indices = (order[start:start + batch_size] for start in range(0, stop, batch_size))
+        if augment is None:
+            augment = split == 'train'
+        transforms = self.__dict__.get('_augmentation', list()) if augment else list()
+        # The seed of each batch is drawn here, in order, so the augmentation does not depend on the threads:
+        jobs = ((index, transforms, seeds.integers(1 << 62) if transforms else None) for index in indices)
+        if prefetch <= 0:
+            for job in jobs:
+                yield self._gather(split, *job)
+            return
+        executor = ThreadPoolExecutor(max_workers=max(workers, 1))
+        pending = deque()
+        try:
+            for job in jobs:
+                pending.append(executor.submit(self._gather, split, *job))
+                if len(pending) > prefetch:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def gather(self, split: str, index) -> tuple:
+        """
+        This method reads some rows of one dataset as a batch, like the batches of batches(): decoded, normalized and
+        padded to the longest sequence for ragged databases. The rows are read in ascending order (forward through
+        memory-mapped files) and returned in that order, whatever the order of the index.
+        :param split: The dataset: 'train', 'val' or 'test'.
+        :param index: The row numbers to read.
+        :return: A tuple (x, y) with the rows.
+        """
+        if split not in ('train', 'val', 'test'):
+            raise ValueError(f'BaseNetDatabase: Unknown split "{split}", expecting "train", "val" or "test".')
+        return self._gather(split, np.asarray(index, dtype=np.int64))
+
+    def sampler(self, split: str = 'train', weights=None, batch_size: int = None, samples: int = None,
+                seed: (int, np.random.Generator, None) = None):
+        """
+        This method builds a class-balanced sampler of one dataset. The sampler draws the indices of each batch with
+        per-class weights from the per-class index arrays of the labels, so the classes are balanced without copying
+        any instance. Every iteration over the sampler is one epoch of new draws (with replacement):
+
+            my_sampler = my_database.sampler('train', seed=0)
+            for xbatch, ybatch in my_database.batches(sampler=my_sampler):
+                ...
+            my_model.fit(sampler=my_sampler)
+
+        :param split: The dataset to sample: 'train', 'val' or 'test'.
+        :param weights: The weight of the instances of each class, as a sequence or a {class: weight} dictionary.
+        The default (None or 'balanced') is the inverse of the class frequency, so every class is drawn equally.
+        :param batch_size: The batch size. The default is the batch_size of the database.
+        :param samples: Number of instances drawn per epoch. The default is the size of the dataset.
+        :param seed: Seed or np.random.Generator used to draw the indices.
+        :return: The sampler, an iterable of index arrays.
+        """
+        if split not in ('train', 'val', 'test'):
+            raise ValueError(f'BaseNetDatabase: Unknown split "{split}", expecting "train", "val" or "test".')
+        y = getattr(self, f'y{split}')
+        # The strata are the class ids themselves, so the weights refer to the classes even if some are missing:
+        strata = np.asarray(y).reshape(len(y)).astype(np.int64) if getattr(self, 'sparse_labels', False) else \
+            self._strata(y)
+        if not len(strata):
+            raise ValueError(f'BaseNetDatabase: Cannot sample the empty {split} dataset.')
+        counts = np.bincount(strata, minlength=self._classes())
+        if weights is None or (isinstance(weights, str) and weights == 'balanced'):
+            probabilities = (counts > 0).astype(np.float64)
+        else:
+            if isinstance(weights, dict):
+                weights = [weights.get(number, 0.0) for number in range(len(counts))]
+            weights = np.asarray(weights, dtype=np.float64)
+            if len(weights) != len(counts) or (weights < 0).any():
+                raise ValueError(f'BaseNetDatabase: Expecting {len(counts)} non-negative class weights, '
+                                 f'given {len(weights)}.')
+            probabilities = weights * counts
+        if not probabilities.sum():
+            raise ValueError('BaseNetDatabase: The class weights cannot all be zero.')
+        return _ClassSampler(self, split, strata, probabilities / probabilities.sum(),
+                             self.batch_size if batch_size is None else batch_size,
+                             len(strata) if samples is None else samples, seed)
+
+    def augment(self, *transforms):
+        """
+        This method attaches an augmentation stage to the BaseNetDatabase. The transforms are applied, in order, to
+        every train batch of batches() and BaseNetModel.fit, in the threads that gather the batches:
+
+            my_database.augment(BaseNetAugmentation.flip(axis=2), BaseNetAugmentation.noise(0.01))
+
+        The stage is kept by copies and merges of the database, but it is not saved in the container file.
+        :param transforms: Callables transform(x, y, rng) -> (x, y) working on a whole batch (see BaseNetAugmentation).
+        Calling augment() without transforms removes the stage.
+        :return: Self object.
+        """
+        if not all(callable(transform) for transform in transforms):
+            raise ValueError('BaseNetDatabase: The augmentation transforms must be callables transform(x, y, rng).')
+        self._augmentation = list(transforms)
+        return self
+
+    def normalize(self, method: (str, None) = 'standard', split: str = 'train', epsilon: float = 1e-7):
+        """
+        This method declares a per-feature normalization of the inputs. Its parameters are computed once from the
+        statistics of one dataset (see statistics()) and kept (and saved) with the database; the stored inputs are not
+        modified. The normalization is applied with decode(), so every batch of batches() and BaseNetModel.fit is
+        normalized on the fly, fused with the rescale of compact databases:
+
+            *   'standard': (x - mean) / std.
+            *   'minmax': (x - min) / (max - min), in [0, 1] for the instances of the dataset.
+
+        Sparse inputs are only scaled, so they stay sparse: by their std ('standard') or by their maximum absolute value
+        ('minmax'). Features with a constant value are only shifted. The parameters are exported with preprocessing().
+        :param method: The method: 'standard', 'minmax' or None to remove the normalization.
+        :param split: The dataset used to compute the parameters: 'train', 'val' or 'test'.
+        :param epsilon: The minimum std or range of a feature; smaller ones are not scaled.
+        :return: Self object.
+        """
+        if method is None:
+            self.normalization = None
+            return self
+        if method not in ('standard', 'minmax'):
+            raise ValueError(f'BaseNetDatabase: Unknown normalization "{method}", expecting "standard" or "minmax".')
+        statistics = self.statistics(split)
+        if not statistics['count']:
+            raise ValueError(f'BaseNetDatabase: Cannot normalize with the empty {split} dataset.')
+        if method == 'standard':
+            shift, scale = statistics['mean'], statistics['std']
+        elif _issparse(getattr(self, f'x{split}')):
+            shift, scale = statistics['min'], np.maximum(np.abs(statistics['min']), np.abs(statistics['max']))
+        else:
+            shift, scale = statistics['min'], statistics['max'] - statistics['min']
+        if _issparse(getattr(self, f'x{split}')):
+            shift = np.zeros_like(shift)
+        self.normalization = {'method': method, 'split': split, 'shift': np.array(shift, dtype=np.float64),
+                              'scale': np.where(scale > epsilon, scale, 1.0).astype(np.float64)}
+        return self
+
+    def preprocessing(self):
+        """
+        This method exports the decoding of the inputs (cast, rescale and normalization) as a standalone function,
+        preprocess(x) -> model inputs, so the same parameters can be used out of the database, i.e. with
+        BaseNetDeployment(models, preprocess=my_database.preprocessing()). The function can be pickled.
+        :return: The preprocessing function.
+        """
+        normalization = getattr(self, 'normalization', None)
+        return functools.partial(_decode, dtype=self.dtype[0], rescale=getattr(self, 'rescale', 1.0),
+                                 normalization=None if normalization is None else dict(normalization))
+
+    def buckets(self, split: str = 'train', boundaries=None, batch_size: int = None, n_buckets: int = 8,
+                seed: (int, np.random.Generator, None) = None):
+        """
+        This method builds a length-bucketed sampler of one dataset of ragged sequences. The sequences are grouped in
+        buckets of similar length and every batch is drawn from a single bucket, so the batches (padded to their own
+        longest sequence) carry little padding. Every iteration over the sampler is one epoch: the sequences are
+        shuffled inside their buckets and the batches are shuffled:
+
+            for xbatch, ybatch in my_database.batches(sampler=my_database.buckets('train', seed=0)):
+                ...
+
+        :param split: The dataset to sample: 'train', 'val' or 'test'.
+        :param boundaries: The upper length (excluded) of each bucket but the last one. The default are the quantiles
+        of the lengths of the sequences.
+        :param batch_size: The batch size. The default is the batch_size of the database.
+        :param n_buckets: Number of buckets when the boundaries are not given.
+        :param seed: Seed or np.random.Generator used to shuffle.
+        :return: The sampler, an iterable of index arrays.
+        """
+        if split not in ('train', 'val', 'test'):
+            raise ValueError(f'BaseNetDatabase: Unknown split "{split}", expecting "train", "val" or "test".')
+        x = getattr(self, f'x{split}')
+        if not isinstance(x, BaseNetRaggedArray):
+            raise ValueError('BaseNetDatabase: Only databases of ragged sequences can be bucketed by length.')
+        lengths = x.lengths
+        if boundaries is None:
+            quantiles = np.linspace(0, 1, n_buckets + 1)[1:-1]
+            boundaries = np.unique(np.quantile(lengths, quantiles)) if len(lengths) else np.empty(0)
+        bucket_ids = np.searchsorted(np.asarray(boundaries), lengths, side='right')
+        return _LengthBuckets(self, split, bucket_ids, self.batch_size if batch_size is None else batch_size, seed)
+
+    def kfold(self, k: int = 5, stratified: bool = False, seed: (int, np.random.Generator, None) = None):
+        """
+        This method yields the k folds of the train dataset for cross-validation. No data is copied: each fold is a
+        pair of BaseNetDatabaseView objects holding index arrays into this database.
+
+            for train_view, val_view in my_database.kfold(5, stratified=True):
+                my_lmse = BaseNetLMSE(train_view)
+                my_lmse.evaluate(my_metric)
+
+        :param k: Number of folds.
+        :param stratified: If True, the class proportions of ytrain are kept in every fold.
+        :param seed: Seed or np.random.Generator used to assign the folds.
+        :return: A generator of (train_view, val_view) tuples. The train_view has the k-1 training folds as its train
+        dataset and the held-out fold as its validation dataset (and the original test dataset), so it can be fitted
+        directly. The val_view has the held-out fold as its validation and test datasets.
+        """
+        if not isinstance(k, int) or k < 2:
+            raise ValueError(f'BaseNetDatabase: The number of folds must be an integer greater than 1, given {k}.')
+        ntrain = self._length('xtrain')
+        if ntrain < k:
+            raise ValueError(f'BaseNetDatabase: Cannot build {k} folds from {ntrain} train instances.')
+        rng = np.random.default_rng(seed)
+        if stratified:
+            permutation, grouping, _ = self._stratified_order(self._strata(self.ytrain), rng)
+            order = permutation[grouping]
+        else:
+            order = rng.permutation(ntrain)
+        folds = np.empty(ntrain, dtype=np.int32)
+        folds[order] = np.arange(ntrain, dtype=np.int32) % k
+        index_dtype = np.int32 if ntrain < np.iinfo(np.int32).max else np.int64
+        empty = np.empty(0, dtype=index_dtype)
+        for fold in range(k):
+            held_out = np.flatnonzero(folds == fold).astype(index_dtype)
+            kept = np.flatnonzero(folds != fold).astype(index_dtype)
+            train_view = BaseNetDatabaseView(self, {'train': ('train', kept), 'val': ('train', held_out),
+                                                    'test': ('test', None)}, name=f'{self.name}_fold{fold}')
+            val_view = BaseNetDatabaseView(self, {'train': ('train', empty), 'val': ('train', held_out),
+                                                  'test': ('train', held_out)}, name=f'{self.name}_fold{fold}_val')
+            yield train_view, val_view
+
     @staticmethod
     def from_datasets(train: tuple, val: tuple, test: tuple, batch_size: int = None,
                       name: str = 'unnamed_database', dtype: tuple[str, str] = ('float', 'float'),
@@ -237,17 +870,24 @@ class BaseNetDatabase:
         try:
             reversioned.dtype = (f'{dtype[0]}{bits[0]}', f'{dtype[1]}{bits[1]}')
 
-            _train = list(np.array(train[0]) / rescale)
-            _test = list(np.array(test[0]) / rescale)
-            _val = list(np.array(val[0]) / rescale)
+            if _issparse(train[0]):
+                reversioned.xtrain = BaseNetDatabase._sparse_inputs(train[0], rescale, reversioned.dtype[0])
+                reversioned.xval = BaseNetDatabase._sparse_inputs(val[0], rescale, reversioned.dtype[0])
+                reversioned.xtest = BaseNetDatabase._sparse_inputs(test[0], rescale, reversioned.dtype[0])
+            else:
+                _train = list(np.array(train[0]) / rescale)
+                _test = list(np.array(test[0]) / rescale)
+                _val = list(np.array(val[0]) / rescale)
 
-            reversioned.xtrain = np.array(_train, dtype=reversioned.dtype[0])
-            reversioned.xval = np.array(_val, dtype=reversioned.dtype[0])
-            reversioned.xtest = np.array(_test, dtype=reversioned.dtype[0])
+                reversioned.xtrain = np.array(_train, dtype=reversioned.dtype[0])
+                reversioned.xval = np.array(_val, dtype=reversioned.dtype[0])
+                reversioned.xtest = np.array(_test, dtype=reversioned.dtype[0])
             reversioned.ytrain = np.array(train[1], dtype=reversioned.dtype[1])
             reversioned.yval = np.array(val[1], dtype=reversioned.dtype[1])
             reversioned.ytest = np.array(test[1], dtype=reversioned.dtype[1])
-            reversioned.size = (len(train[0]), len(val[0]), len(test[0]))
+            reversioned.size = (reversioned.xtrain.shape[0], reversioned.xval.shape[0], reversioned.xtest.shape[0])
+            reversioned.shape = (reversioned.xtrain.shape[1:], reversioned.ytrain.shape[1:])
+            reversioned.n_classes = reversioned.shape[1][-1] if reversioned.shape[1] else None
             reversioned.name = name
             ssize = sum(reversioned.size)
             reversioned.distribution = (100 * reversioned.size[0] / ssize, 100 * reversioned.size[1] / ssize,
@@ -255,8 +895,8 @@ class BaseNetDatabase:
 
             if batch_size is None:
                 reversioned.batch_size = 1
-                if len(train[0]) > 0:
-                    reversioned.batch_size = 2 ** round(np.log2(len(train[0]) / 256))
+                if reversioned.size[0] > 0:
+                    reversioned.batch_size = 2 ** round(np.log2(reversioned.size[0] / 256))
                 if reversioned.batch_size < 1:
                     reversioned.batch_size = 1
             else:
@@ -275,6 +915,109 @@ class BaseNetDatabase:
         finally:
             return reversioned
 
+    @staticmethod
+    def from_stream(source, y_hint=None, chunk_rows: int = 65_536, rows: int = None, distribution: dict = None,
+                    name: str = 'unnamed_database', batch_size: int = None, rescale: float = 1.0,
+                    dtype: tuple[str, str] = ('float', 'float'), bits: tuple[int, int] = (32, 32),
+                    seed: (int, np.random.Generator, None) = None, sparse_labels: bool = False,
+                    compact: bool = False):
+        """
+        This method builds the BaseNetDatabase from a stream of batches, without holding the whole source in memory.
+        Each batch is converted to the database data types and routed straight into the train, validation and test
+        buffers, so the peak memory is close to one batch plus the final arrays.
+
+            my_database = BaseNetDatabase.from_stream(pd.read_csv('my_data.csv', chunksize=10_000), y_hint='label')
+            my_database = BaseNetDatabase.from_stream(my_tf_dataset.batch(1024), y_hint=('image', 'label'))
+
+        :param source: An iterable of batches: DataFrames (i.e. pandas chunked readers), dictionaries (i.e. batched
+        tf.data pipelines) or (x, y) tuples. A single DataFrame is read in chunks of chunk_rows rows.
+        :param y_hint: The label column for DataFrames (default: the last column) or the (x, y) keys for dictionaries
+        (default: ('x', 'y')).
+        :param chunk_rows: Number of rows per chunk when the source is a single DataFrame.
+        :param rows: Expected number of rows, if known, to preallocate the buffers.
+        :param distribution: The distribution of the datasets, default: {'train': 70, 'val': 20, 'test': 10}
+        :param name: The database name.
+        :param batch_size: Custom batch size for training.
+        :param rescale: Rescale factor, all the values in x are divided by this factor, in case rescale is needed.
+        :param dtype: Data type of the dataset. ('input', 'output') (x, y)
+        :param bits: Bits used for the data type. ('input', 'output') (x, y)
+        :param seed: Seed or np.random.Generator for the train, validation and test split. Random if not provided.
+        :param sparse_labels: Keeps integer labels as class indices instead of encoding them as one-hot vectors.
+        :param compact: Keeps x in its native data type and defers the rescale and the cast to the batches.
+        :return: The built BaseNetDatabase.
+        """
+        streamed = BaseNetDatabase([], [])
+        try:
+            streamed.dtype = (f'{dtype[0]}{bits[0]}', f'{dtype[1]}{bits[1]}')
+            if distribution is None:
+                _distribution = (70, 20, 10)
+            else:
+                _distribution = (distribution['train'], distribution['val'], distribution['test'])
+            rng = np.random.default_rng(seed)
+            buffers = None
+            top = None
+            x_dtype = None if compact else streamed.dtype[0]
+            for xc, yc in BaseNetDatabase._stream_chunks(source, y_hint, chunk_rows, x_dtype):
+                if rescale != 1 and not compact:
+                    xc = (xc / rescale).astype(streamed.dtype[0], copy=False)
+                if buffers is None:
+                    capacities = [chunk_rows] * 3 if rows is None else \
+                        [round(rows * _ / 100) + 1 for _ in _distribution]
+                    buffers = [(_GrowableBuffer(xc.shape[1:], xc.dtype, capacity),
+                                _GrowableBuffer(yc.shape[1:], yc.dtype, capacity)) for capacity in capacities]
+                if yc.ndim == 1 and yc.size:
+                    top = yc.max() if top is None else max(top, yc.max())
+                routes = BaseNetDatabase._route(tuple(len(_[0]) for _ in buffers), len(xc), _distribution, rng)
+                for split, (xbuffer, ybuffer) in enumerate(buffers):
+                    selected = routes == split
+                    xbuffer.extend(xc[selected])
+                    ybuffer.extend(yc[selected])
+            if buffers is None:
+                raise ValueError('BaseNetDatabase: The stream is empty.')
+
+            arrays = list()
+            for xbuffer, ybuffer in buffers:
+                _x, _y = xbuffer.trim(), ybuffer.trim()
+                # Rows are routed in stream order: shuffle x and y in place with the same permutation.
+                state = rng.bit_generator.state
+                rng.shuffle(_x)
+                rng.bit_generator.state = state
+                rng.shuffle(_y)
+                if _y.size:
+                    _y, streamed.n_classes = BaseNetDatabase._to_binary(_y, streamed.dtype[1], sparse_labels, top)
+                arrays.append((_x, _y.astype(streamed.dtype[1], copy=False)))
+            ((streamed.xtrain, streamed.ytrain), (streamed.xval, streamed.yval),
+             (streamed.xtest, streamed.ytest)) = arrays
+            del buffers, arrays
+
+            streamed.name = name
+            streamed.seed = seed
+            streamed.sparse_labels = sparse_labels
+            streamed.rescale = rescale if compact else 1.0
+            streamed.distribution = _distribution
+            streamed.size = (len(streamed.xtrain), len(streamed.xval), len(streamed.xtest))
+            streamed.shape = (streamed.xtrain.shape[1:], streamed.ytrain.shape[1:])
+            if batch_size is None:
+                streamed.batch_size = 1
+                if streamed.size[0] > 0:
+                    streamed.batch_size = 2 ** round(np.log2(streamed.size[0] / 256))
+                if streamed.batch_size < 1:
+                    streamed.batch_size = 1
+            else:
+                streamed.batch_size = batch_size
+
+            streamed.is_valid = False
+            if sum(_distribution) == 100:
+                streamed._check_validation()
+            else:
+                logging.warning('BaseNetDatabase: The sum of the distributions for train, validation and test does not '
+                                'add up to 100%')
+        except Exception as ex:
+            streamed.is_valid = False
+            logging.error(f'BaseNetDatabase: Error while building the database, raised the following exception: {ex}')
+        finally:
+            return streamed
+
     def define_map(self, mapping: list):
         """
         The method define_map defines an output map from the given mapping list.
@@ -306,7 +1049,7 @@ class BaseNetDatabase:
         :return: Self object.
         :rtype: BaseNetDatabase
         """
-        if self.shape[1][0] == len(mapping):
+        if self._classes() == len(mapping):
             self.mapping = (mapping, True)
         else:
             ranges = np.linspace(0, 1, len(mapping) + 1)[1:]
@@ -342,33 +1085,38 @@ class BaseNetDatabase:
         :return: The mapped data.
         :rtype: np.ndarray (strings)
         """
-        if self.mapping is None:
+        if self.mapping is None or self.mapping[0] is None:
             logging.warning('BaseNetDatabase: There is not map defined. Use the method .define_map() '
                             'to define an output map first.')
             return output_data
         else:
             mappings: (tuple, list) = self.mapping[0]
             is_categorical: bool = self.mapping[1]
-            mapped_output = list()
+            output_data = np.asarray(output_data)
             if is_categorical:
-                names = mappings
-                for data in output_data:
-                    _max_cat = np.argmax(data)
-                    mapped_output.append(names[_max_cat])
+                names = np.asarray(mappings)
+                return names[np.argmax(output_data, axis=-1)]
             else:
-                ranges = mappings[0]
-                names = mappings[1]
-                for data in output_data:
-                    values = list()
-                    for value in data:
-                        for index, top_fuzzy in enumerate(ranges):
-                            if value <= top_fuzzy:
-                                values.append(names[index])
-                                break
-                        else:
-                            continue
-                    mapped_output.append(data)
-            return np.array(mapped_output)
+                ranges = np.asarray(mappings[0])
+                names = np.asarray(mappings[1])
+                # Each value takes the name of the first range that is greater or equal than the value.
+                indexes = np.digitize(output_data, ranges, right=True)
+                return names[np.minimum(indexes, len(names) - 1)]
+
+    def map_stream(self, output_batches):
+        """
+        The map_stream() method maps an iterable of output batches, i.e. the predictions of a model over a batched
+        input, batch by batch. See BaseNetDatabase.map().
+
+            for labels in my_database.map_stream(my_model.predict(batch) for batch in my_batches):
+                ...
+
+        :param output_batches: An iterable of output batches from some model.
+        :return: A generator with the mapped batches.
+        :rtype: generator of np.ndarray (strings)
+        """
+        for output_data in output_batches:
+            yield self.map(output_data)
 
     # Private methods:
     @staticmethod
@@ -388,14 +1136,254 @@ class BaseNetDatabase:
             reversioned.shape = input_db.shape
         if hasattr(input_db, 'mapping'):
             reversioned.mapping = input_db.mapping
+        reversioned.n_classes = getattr(input_db, 'n_classes', None)
+        reversioned.sparse_labels = getattr(input_db, 'sparse_labels', False)
+        reversioned.rescale = getattr(input_db, 'rescale', 1.0)
+        reversioned.normalization = getattr(input_db, 'normalization', None)
         reversioned._check_validation()
         return reversioned
 
+    # Container format:
+    def _header(self) -> dict:
+        # This function builds the metadata header of the container, without the array blocks.
+        mapping, is_categorical = self.mapping
+        if mapping is not None and not is_categorical:
+            mapping = (np.asarray(mapping[0]).tolist(), list(mapping[1]))
+        normalization = getattr(self, 'normalization', None)
+        if normalization is not None:
+            normalization = {key: value for key, value in normalization.items() if key not in __normalization_parts__}
+        return {'version': __version__, 'name': self.name, 'size': list(self.size),
+                'shape': [list(self.shape[0]), list(self.shape[1])], 'dtype': list(self.dtype),
+                'distribution': list(self.distribution), 'batch_size': int(self.batch_size),
+                'mapping': [mapping, is_categorical], 'n_classes': getattr(self, 'n_classes', None),
+                'sparse_labels': getattr(self, 'sparse_labels', False), 'rescale': getattr(self, 'rescale', 1.0),
+                'normalization': normalization,
+                'statistics': {split: running.to_dict(features=False) for split, running in
+                               self.__dict__.get('_statistics', dict()).items()},
+                'checksum': 0, 'arrays': dict()}
+
+    @staticmethod
+    def _decode_mapping(mapping: list) -> tuple:
+        mapping, is_categorical = mapping
+        if mapping is not None and not is_categorical:
+            mapping = (np.array(mapping[0]), mapping[1])
+        return mapping, is_categorical
+
+    def _layout(self) -> tuple:
+        # This function builds the header of the container with the place of every block, without reading the arrays.
+        # The block offsets are relative to the data section, so the header length does not depend on them.
+        # Sparse arrays are stored as the three blocks (data, indices, indptr) of their CSR matrix, and ragged arrays
+        # as their values and offsets. Merged databases keep one piece per segment.
+        header = self._header()
+        blocks = list()
+        for array_name in __array_names__:
+            pieces = self._pieces(array_name)
+            if any(_is_compressed(piece) for piece in pieces):
+                matrix = _canonical(pieces)
+                fmt = 'ragged' if isinstance(matrix, BaseNetRaggedArray) else 'csr'
+                entry = {'format': fmt, 'dtype': matrix.dtype.str, 'shape': list(matrix.shape)}
+                for part_name in __compressed_parts__[fmt]:
+                    part = getattr(matrix, part_name)
+                    entry[part_name] = {'dtype': part.dtype.str, 'shape': list(part.shape)}
+                    blocks.append((entry[part_name], [part]))
+            else:
+                dtype = np.result_type(*pieces)
+                entry = {'dtype': dtype.str, 'shape': [sum(piece.shape[0] for piece in pieces)] +
+                         list(pieces[0].shape[1:])}
+                blocks.append((entry, pieces))
+            header['arrays'][array_name] = entry
+        # The per-feature vectors (statistics and normalization) are raw blocks too, after the arrays, so the header
+        # stays small:
+        vectors = [(header['statistics'][split], part_name, getattr(running, part_name)) for split, running in
+                   self.__dict__.get('_statistics', dict()).items() for part_name in __statistics_parts__]
+        if header['normalization'] is not None:
+            vectors.extend((header['normalization'], part_name, self.normalization[part_name])
+                           for part_name in __normalization_parts__)
+        for owner, part_name, vector in vectors:
+            entry = {'dtype': vector.dtype.str, 'shape': list(vector.shape)}
+            owner[part_name] = entry
+            blocks.append((entry, [vector]))
+        offset = 0
+        for block, _ in blocks:
+            block['offset'] = offset
+            nbytes = np.dtype(block['dtype']).itemsize * int(np.prod(block['shape']))
+            offset += -(-nbytes // __block_alignment__) * __block_alignment__
+        return header, blocks, offset
+
+    @staticmethod
+    def _data_offset(header: dict) -> int:
+        # The data section starts at the first aligned position after the preamble and the header.
+        return -(-(__preamble__.size + len(json.dumps(header).encode('utf-8'))) // __data_alignment__) * \
+            __data_alignment__
+
+    def _write_container(self, file):
+        # This function writes the header followed by one raw, aligned block per array.
+        # Merged databases are written segment by segment, without joining them in memory.
+        header, blocks, length = self._layout()
+        header['fingerprint'] = self.fingerprint()
+        blocks = [(block, [np.ascontiguousarray(piece, dtype=block['dtype']) for piece in pieces])
+                  for block, pieces in blocks]
+        for block, pieces in blocks:
+            for piece in pieces:
+                header['checksum'] = zlib.crc32(piece.reshape(-1).view(np.uint8), header['checksum'])
+        encoded = json.dumps(header).encode('utf-8')
+        data_offset = self._data_offset(header)
+        file.write(__preamble__.pack(__magic__, __format_version__, 0, len(encoded)))
+        file.write(encoded)
+        for block, pieces in blocks:
+            file.seek(data_offset + block['offset'])
+            for piece in pieces:
+                file.write(piece.reshape(-1).view(np.uint8))
+        file.truncate(data_offset + length)
+
+    @staticmethod
+    def _read_header(file) -> (dict, None):
+        # This function reads the container header. Returns None if the file is not a container (legacy pickle).
+        preamble = file.read(__preamble__.size)
+        if len(preamble) < __preamble__.size:
+            return None
+        magic, format_version, _, header_length = __preamble__.unpack(preamble)
+        if magic != __magic__:
+            return None
+        if format_version > __format_version__:
+            raise ValueError(f'BaseNetDatabase: Unknown container format version {format_version}.')
+        header = json.loads(file.read(header_length).decode('utf-8'))
+        header['data_offset'] = -(-(__preamble__.size + header_length) // __data_alignment__) * __data_alignment__
+        return header
+
+    @staticmethod
+    def _shared_layout(paths: list, headers: list) -> dict:
+        # This function places the merged arrays in one shared block and lists, per file, where each of its blocks is
+        # read from and written to: {array_name: (file offset, dtype, shape, first row, last row)}.
+        first = headers[0]
+        for path, header in zip(paths[1:], headers[1:]):
+            for key in ('mapping', 'rescale', 'normalization', 'n_classes', 'sparse_labels'):
+                if key == 'normalization' and header.get(key) is not None and first.get(key) is not None:
+                    same = header[key].keys() == first[key].keys() and \
+                        all(np.array_equal(header[key][name], first[key][name]) for name in first[key])
+                else:
+                    same = header.get(key) == first.get(key)
+                if not same:
+                    raise ValueError(f'BaseNetDatabase: Cannot merge {path}, its {key} differs from {paths[0]}.')
+        layout = {'arrays': dict(), 'jobs': [dict() for _ in paths], 'nbytes': 0}
+        for array_name in __array_names__:
+            blocks = [header['arrays'][array_name] for header in headers]
+            if any('format' in block for block in blocks):
+                raise ValueError(f'BaseNetDatabase: The sparse or ragged {array_name} cannot be loaded in shared '
+                                 f'memory, load the databases with load() and merge them.')
+            dtype = np.result_type(*[np.dtype(block['dtype']) for block in blocks])
+            row_shape = list(blocks[0]['shape'][1:])
+            rows = 0
+            for number, (path, header, block) in enumerate(zip(paths, headers, blocks)):
+                if list(block['shape'][1:]) != row_shape and block['shape'][0]:
+                    raise ValueError(f'BaseNetDatabase: Cannot merge {path}, its {array_name} has shape '
+                                     f'{block["shape"][1:]} instead of {row_shape}.')
+                offset = header.get('data_offset', 0) + block.get('offset', 0)
+                layout['jobs'][number][array_name] = (offset, block['dtype'], block['shape'], rows,
+                                                      rows + block['shape'][0])
+                rows += block['shape'][0]
+            shape = tuple([rows] + row_shape)
+            layout['arrays'][array_name] = (layout['nbytes'], dtype, shape)
+            nbytes = dtype.itemsize * int(np.prod(shape))
+            layout['nbytes'] += -(-nbytes // __block_alignment__) * __block_alignment__
+        return layout
+
+    @staticmethod
+    def _merged_statistics(statistics: list, split: str) -> dict:
+        running = _RunningStatistics.from_dict(statistics[0][split])
+        for other in statistics[1:]:
+            running = running.merge(_RunningStatistics.from_dict(other[split]))
+        return running.to_dict()
+
+    @staticmethod
+    def _blocks(header: dict) -> list:
+        # This function lists the raw blocks of a container in the order they are written.
+        blocks = list()
+        for array_name in __array_names__:
+            entry = header['arrays'][array_name]
+            if 'format' in entry:
+                blocks.extend(entry[part_name] for part_name in __compressed_parts__[entry['format']])
+            else:
+                blocks.append(entry)
+        blocks.extend(owner[part_name] for owner, part_name in BaseNetDatabase._vector_slots(header))
+        return blocks
+
+    @staticmethod
+    def _vector_slots(header: dict) -> list:
+        # This function lists where the header describes a per-feature vector block, as (owner, key) pairs in the order
+        # they are written. Containers from older versions keep the vectors inline and have none.
+        slots = [(running, part_name) for running in header.get('statistics', dict()).values()
+                 for part_name in __statistics_parts__]
+        if header.get('normalization') is not None:
+            slots.extend((header['normalization'], part_name) for part_name in __normalization_parts__)
+        return [(owner, part_name) for owner, part_name in slots if isinstance(owner.get(part_name), dict)]
+
+    @staticmethod
+    def _read_vectors(file, path: str, header: dict):
+        # This function reads the per-feature vector blocks into their place of the header.
+        for owner, part_name in BaseNetDatabase._vector_slots(header):
+            owner[part_name] = BaseNetDatabase._read_block(file, path, owner[part_name], header['data_offset'], False)
+
+    @staticmethod
+    def _read_array(file, path: str, entry: dict, data_offset: int, mmap: bool):
+        # This function reads (or maps) an array of the container, building the CSR matrix of sparse arrays and the
+        # BaseNetRaggedArray of ragged arrays.
+        if entry.get('format') == 'ragged':
+            return BaseNetRaggedArray(*[BaseNetDatabase._read_block(file, path, entry[part_name], data_offset, mmap)
+                                        for part_name in __compressed_parts__['ragged']])
+        if entry.get('format') == 'csr':
+            if scipy_sparse is None:
+                raise ImportError('BaseNetDatabase: scipy is required to load databases with sparse inputs.')
+            parts = [BaseNetDatabase._read_block(file, path, entry[part_name], data_offset, mmap)
+                     for part_name in ('data', 'indices', 'indptr')]
+            return scipy_sparse.csr_matrix(tuple(parts), shape=tuple(entry['shape']))
+        return BaseNetDatabase._read_block(file, path, entry, data_offset, mmap)
+
+    @staticmethod
+    def _read_block(file, path: str, block: dict, data_offset: int, mmap: bool) -> np.ndarray:
+        # This function reads (or maps) a single array block of the container.
+        dtype = np.dtype(block['dtype'])
+        shape = tuple(block['shape'])
+        count = int(np.prod(shape))
+        if count == 0:
+            return np.empty(shape, dtype=dtype)
+        if mmap:
+            return np.memmap(path, dtype=dtype, mode='r', offset=data_offset + block['offset'], shape=shape)
+        file.seek(data_offset + block['offset'])
+        return np.fromfile(file, dtype=dtype, count=count).reshape(shape)
+
+    @staticmethod
+    def _from_header(header: dict, arrays: dict):
+        # This function builds a BaseNetDatabase from a container header and its arrays.
+        reversioned = BaseNetDatabase([], [])
+        for array_name in __array_names__:
+            setattr(reversioned, array_name, arrays[array_name])
+        reversioned.name = header['name']
+        reversioned.size = tuple(header['size'])
+        reversioned.shape = (tuple(header['shape'][0]), tuple(header['shape'][1]))
+        reversioned.dtype = tuple(header['dtype'])
+        reversioned.distribution = tuple(header['distribution'])
+        reversioned.batch_size = header['batch_size']
+        reversioned.mapping = BaseNetDatabase._decode_mapping(header['mapping'])
+        reversioned.n_classes = header.get('n_classes')
+        reversioned.sparse_labels = header.get('sparse_labels', False)
+        reversioned.rescale = header.get('rescale', 1.0)
+        normalization = header.get('normalization')
+        if normalization is not None:
+            normalization = dict(normalization, shift=np.array(normalization['shift'], dtype=np.float64),
+                                 scale=np.array(normalization['scale'], dtype=np.float64))
+        reversioned.normalization = normalization
+        reversioned._check_validation()
+        reversioned.__dict__['_fingerprint'] = header.get('fingerprint')
+        reversioned.__dict__['_statistics'] = {split: _RunningStatistics.from_dict(running) for split, running in
+                                               header.get('statistics', dict()).items()}
+        return reversioned
+
     def _check_validation(self):
         if sum(self.size) > 0:
-            c_train = len(self.xtrain) == len(self.ytrain)
-            c_test = len(self.xtest) == len(self.ytest)
-            c_val = len(self.xval) == len(self.yval)
+            c_train = self._length('xtrain') == self._length('ytrain')
+            c_test = self._length('xtest') == self._length('ytest')
+            c_val = self._length('xval') == self._length('yval')
             if c_test and c_train and c_val:
                 self.is_valid = True
             else:
@@ -404,34 +1392,67 @@ class BaseNetDatabase:
             self.is_valid = False
 
     @staticmethod
-    def _splitdb(setz: tuple, split: tuple) -> tuple:
+    def _splitdb(setz: tuple, split: tuple, seed: (int, np.random.Generator, None) = None,
+                 strata: np.ndarray = None) -> tuple:
         # This function splits the database into test, train and validation from a single distribution.
-        total = len(setz[0])
-        xtrain = list()
-        ytrain = list()
-        xval = list()
-        yval = list()
+        # A single permutation of the row indices is drawn, so x and y stay as contiguous arrays.
+        total = setz[0].shape[0]
         ntrain = round(total * split[0] / 100)
         nval = round(total * split[1] / 100)
         ntest = total - ntrain - nval
         if ntest >= 0:
-            for _ in range(ntrain):
-                topop = random.randint(0, len(setz[0]) - 1)
-                xtrain.append(setz[0].pop(topop))
-                ytrain.append(setz[1].pop(topop))
-            for _ in range(nval):
-                topop = random.randint(0, len(setz[0]) - 1)
-                xval.append(setz[0].pop(topop))
-                yval.append(setz[1].pop(topop))
-            xtest = setz[0]
-            ytest = setz[1]
+            rng = np.random.default_rng(seed)
+            if strata is None:
+                permutation = rng.permutation(total)
+                itrain = permutation[:ntrain]
+                ival = permutation[ntrain:ntrain + nval]
+                itest = permutation[ntrain + nval:]
+            else:
+                # Each row is placed at the middle of its slot within its stratum (systematic interleaving) and the
+                # rows are cut at the global train and validation sizes in that order, so the sizes are the same as
+                # without strata and every stratum is spread over the splits. The ties keep the random permutation.
+                permutation, order, counts = BaseNetDatabase._stratified_order(strata, rng)
+                starts = np.cumsum(counts) - counts
+                grouped = strata.reshape(total)[permutation][order]
+                position = np.empty(total)
+                position[order] = (np.arange(total) - starts[grouped] + 0.5) / counts[grouped]
+                ranked = np.argsort(position, kind='stable')
+                routes = np.empty(total, dtype=np.int8)
+                routes[ranked] = np.repeat(np.arange(3, dtype=np.int8), (ntrain, nval, ntest))
+                itrain = permutation[routes == 0]
+                ival = permutation[routes == 1]
+                itest = permutation[routes == 2]
+            x, y = setz
+            xtrain, ytrain = x[itrain], y[itrain]
+            xval, yval = x[ival], y[ival]
+            xtest, ytest = x[itest], y[itest]
         else:
             raise ValueError('BaseNetDatabase: Test size in BaseNetDatabase class is too small.')
         return (xtrain, ytrain), (xtest, ytest), (xval, yval)
 
+    @staticmethod
+    def _stratified_order(strata: np.ndarray, rng: np.random.Generator) -> tuple:
+        # This function draws a random permutation and the stable order that groups it by stratum. The strata are
+        # narrowed to the smallest integer type so the stable sort is a linear radix sort.
+        strata = np.asarray(strata).reshape(-1)
+        permutation = rng.permutation(len(strata))
+        counts = np.bincount(strata) if len(strata) else np.zeros(0, dtype=np.int64)
+        key = strata[permutation].astype(np.min_scalar_type(max(len(counts) - 1, 0)), copy=False)
+        return permutation, np.argsort(key, kind='stable'), counts
+
+    @staticmethod
+    def _sparse_inputs(x, scale, dtype: (str, None)):
+        # This function stores sparse inputs as a CSR matrix; the rescale only touches the non-zero values.
+        matrix = scipy_sparse.csr_matrix(x, dtype=dtype, copy=scale != 1)
+        if scale != 1:
+            np.divide(matrix.data, scale, out=matrix.data, casting='unsafe')
+        return matrix
+
     @staticmethod
     def _rescale(x, scale):
-        return list(np.array(x) / scale)
+        if scale == 1:
+            return np.asarray(x)
+        return np.asarray(x) / scale
 
     def _split(self, other):
         splits_train = np.linspace(0, self.size[0], other + 1)
@@ -452,9 +1473,9 @@ class BaseNetDatabase:
             this_db.ytrain = self.ytrain[last_index_train:split_train]
             this_db.yval = self.yval[last_index_val:split_val]
             this_db.ytest = self.ytest[last_index_test:split_test]
-            this_db.size = (len(this_db.xtrain), len(this_db.xval), len(this_db.xtest))
-            this_db.distribution = (len(this_db.xtrain) / sum(this_db.size), len(this_db.xval) / sum(this_db.size),
-                                    len(this_db.xtest) / sum(this_db.size))
+            this_db.size = (this_db.xtrain.shape[0], this_db.xval.shape[0], this_db.xtest.shape[0])
+            this_db.distribution = (this_db.size[0] / sum(this_db.size), this_db.size[1] / sum(this_db.size),
+                                    this_db.size[2] / sum(this_db.size))
             if this_db.size[0] < this_db.batch_size:
                 this_db.batch_size = this_db.size[0]
                 logging.warning(f'BaseNetDatabase: The splitted database size is lower than the initial batch size. '
@@ -468,55 +1489,252 @@ class BaseNetDatabase:
         return tuple(list_of_dbs)
 
     def _merge(self, other):
-        self.xtrain = np.append(self.xtrain, other.xtrain, axis=0)
-        self.ytrain = np.append(self.ytrain, other.ytrain, axis=0)
-        self.xval = np.append(self.xval, other.xval, axis=0)
-        self.yval = np.append(self.yval, other.yval, axis=0)
-        self.xtest = np.append(self.xtest, other.xtest, axis=0)
-        self.ytest = np.append(self.ytest, other.ytest, axis=0)
-        self.size = (len(self.xtrain), len(self.xval), len(self.xtest))
-        self.distribution = (len(self.xtrain) / sum(self.size), len(self.xval) / sum(self.size),
-                             len(self.xtest) / sum(self.size))
+        # Only the segment lists are built here, the arrays are joined in __getattr__ when they are needed.
+        segments = dict(self.__dict__.get('_segments', dict()))
+        self.__dict__.pop('_fingerprint', None)
+        statistics = self.__dict__.pop('_statistics', dict())
+        other_statistics = other.__dict__.get('_statistics', dict())
+        self._statistics = {split: statistics[split].merge(other_statistics[split]) for split in statistics
+                            if split in other_statistics}
+        for array_name in __array_names__:
+            segments[array_name] = self._pieces(array_name) + other._pieces(array_name)
+            self.__dict__.pop(array_name, None)
+        self._segments = segments
+        self.size = (self._length('xtrain'), self._length('xval'), self._length('xtest'))
+        self.distribution = (self.size[0] / sum(self.size), self.size[1] / sum(self.size),
+                             self.size[2] / sum(self.size))
         self._check_validation()
         return self
 
+    def _classes(self) -> int:
+        # This function returns the cached number of classes, or the label width for older databases.
+        n_classes = getattr(self, 'n_classes', None)
+        if n_classes is not None:
+            return n_classes
+        return self.shape[1][0] if self.shape[1] else 1
+
+    def _balance(self, array_name: str) -> np.ndarray:
+        # This function returns the percentage of each class (or the mean of each output) of a label array.
+        return self.statistics(array_name[1:])['balance']
+
+    def _new_statistics(self):
+        features = int(np.prod([_ for _ in self.shape[0] if _ is not None]))
+        sparse = getattr(self, 'sparse_labels', False)
+        outputs = self._classes() if sparse else (int(np.prod(self.shape[1])) if self.shape[1] else 1)
+        return _RunningStatistics(features, outputs, sparse)
+
+    def _rows(self, array_name: str, start: int, stop: int) -> np.ndarray:
+        # This function returns a range of rows, as a view when the array is not segmented.
+        pieces = self._pieces(array_name)
+        if len(pieces) == 1:
+            return pieces[0][start:stop]
+        return self._take(array_name, np.arange(start, min(stop, self._length(array_name))))
+
     @staticmethod
-    def _to_binary(_y):
+    def _strata(y: np.ndarray) -> np.ndarray:
+        # This function returns one integer stratum per sample: the argmax of one-hot labels or the label value.
+        y = np.asarray(y)
+        if y.ndim > 1 and y.shape[-1] > 1:
+            return np.argmax(y.reshape(len(y), -1), axis=-1)
+        if not np.issubdtype(y.dtype, np.integer) and np.any(np.mod(y, 1)):
+            raise ValueError('BaseNetDatabase: Cannot stratify by continuous labels, give the group key of each '
+                             'instance in stratify instead.')
+        return np.unique(y.reshape(len(y)), return_inverse=True)[1]
+
+    def _encode_appended(self, y: np.ndarray) -> np.ndarray:
+        # This function encodes appended integer labels with the class count of the database.
+        n_classes = getattr(self, 'n_classes', None)
+        sparse = getattr(self, 'sparse_labels', False)
+        if y.ndim == 1 and n_classes is not None and np.issubdtype(y.dtype, np.integer) and y.size:
+            if y.max() >= n_classes or y.min() < 0:
+                raise ValueError(f'BaseNetDatabase: The appended labels must be in the range [0, {n_classes}).')
+            y, _ = self._to_binary(y, self.dtype[1], sparse, n_classes - 1)
+        return y.astype(self.dtype[1], copy=False)
+
+    def _extend(self, array_name: str, rows: np.ndarray):
+        # This function appends rows to the growable buffer of an array. The buffer is (re)built from the current
+        # array when the array was replaced since the last append, i.e. by a merge or an assignment.
+        if _is_compressed(rows) or any(_is_compressed(piece) for piece in self._pieces(array_name)):
+            # Sparse and ragged arrays grow by segments, joined once when the array is accessed.
+            segments = dict(self.__dict__.get('_segments', dict()))
+            segments[array_name] = self._pieces(array_name) + [rows]
+            self.__dict__.pop(array_name, None)
+            self.__dict__.pop('_fingerprint', None)
+            self.__dict__['_segments'] = segments
+            return
+        buffers = self.__dict__.setdefault('_buffers', dict())
+        current = getattr(self, array_name)
+        buffer, view = buffers.get(array_name, (None, None))
+        if buffer is None or view is not current:
+            if len(current):
+                buffer = _GrowableBuffer(current.shape[1:], current.dtype, 2 * len(current) + len(rows))
+                buffer.extend(current)
+            else:
+                dtype = rows.dtype if array_name[0] == 'x' and getattr(self, 'rescale', 1.0) != 1 else \
+                    self.dtype[0 if array_name[0] == 'x' else 1]
+                buffer = _GrowableBuffer(rows.shape[1:], dtype, 2 * len(rows))
+        buffer.extend(rows)
+        view = buffer.view()
+        setattr(self, array_name, view)
+        buffers[array_name] = (buffer, view)
+
+    def _gather(self, split: str, index: np.ndarray, transforms: list = (), seed: int = None) -> tuple:
+        # This function reads one batch. The indices are sorted so memory-mapped files are read forward.
+        # Ragged sequences are padded to the longest sequence of the batch, then the augmentation is applied.
+        index = np.sort(index)
+        x = self.decode(self._take(f'x{split}', index))
+        if isinstance(x, BaseNetRaggedArray):
+            x = x.pad()
+        y = self._take(f'y{split}', index)
+        if transforms:
+            rng = np.random.default_rng(seed)
+            for transform in transforms:
+                x, y = transform(x, y, rng)
+        return x, y
+
+    def _content_hash(self) -> str:
+        # This function streams the arrays (segment by segment) into the hash, with their shapes and data types.
+        digest = hashlib.blake2b(digest_size=16)
+        header = self._header()
+        digest.update(json.dumps([header['mapping'], header['rescale']]).encode('utf-8'))
+        for array_name in __array_names__:
+            pieces = self._pieces(array_name)
+            if any(_is_compressed(piece) for piece in pieces):
+                matrix = _canonical(pieces)
+                fmt = 'ragged' if isinstance(matrix, BaseNetRaggedArray) else 'csr'
+                digest.update(json.dumps([array_name, fmt, matrix.dtype.str, list(matrix.shape)]).encode('utf-8'))
+                for number, part_name in enumerate(__compressed_parts__[fmt]):
+                    part = getattr(matrix, part_name)
+                    part = part.astype(np.int64) if number else part
+                    digest.update(memoryview(np.ascontiguousarray(part)).cast('B'))
+                continue
+            dtype = np.result_type(*pieces)
+            shape = [sum(len(piece) for piece in pieces)] + list(pieces[0].shape[1:])
+            digest.update(json.dumps([array_name, dtype.str, shape]).encode('utf-8'))
+            rows = max(__checksum_chunk__ // max(int(np.prod(shape[1:])) * dtype.itemsize, 1), 1)
+            for piece in pieces:
+                for start in range(0, len(piece), rows):
+                    chunk = np.ascontiguousarray(piece[start:start + rows], dtype=dtype)
+                    digest.update(memoryview(chunk).cast('B'))
+        return digest.hexdigest()
+
+    # Segmented storage:
+    def _pieces(self, array_name: str) -> list:
+        # This function returns the list of blocks of an array, without joining them.
+        if array_name in self.__dict__:
+            return [self.__dict__[array_name]]
+        return list(self.__dict__.get('_segments', dict()).get(array_name, list()))
+
+    def _length(self, array_name: str) -> int:
+        return sum(piece.shape[0] for piece in self._pieces(array_name))
+
+    def _ragged(self, array_name: str) -> bool:
+        # This function tells if an array holds ragged sequences, without joining or gathering it.
+        return any(isinstance(piece, BaseNetRaggedArray) for piece in self._pieces(array_name))
+
+    def _take(self, array_name: str, indices: np.ndarray) -> np.ndarray:
+        # This function gathers rows by index reading straight across the segments of an array.
+        pieces = self._pieces(array_name)
+        if len(pieces) == 1:
+            return pieces[0][indices]
+        indices = np.asarray(indices)
+        bounds = np.cumsum([0] + [piece.shape[0] for piece in pieces])
+        owner = np.searchsorted(bounds, indices, side='right') - 1
+        if any(_is_compressed(piece) for piece in pieces):
+            # Sparse and ragged rows are gathered per segment, joined and put back in the order of the indices.
+            parts, positions = list(), list()
+            for number, piece in enumerate(pieces):
+                selected = np.flatnonzero(owner == number)
+                if len(selected):
+                    parts.append(piece[indices[selected] - bounds[number]])
+                    positions.append(selected)
+            if not parts:
+                return pieces[0][:0]
+            return _concatenate(parts)[np.argsort(np.concatenate(positions), kind='stable')]
+        taken = np.empty((len(indices),) + pieces[0].shape[1:], dtype=np.result_type(*pieces))
+        for number, piece in enumerate(pieces):
+            selected = owner == number
+            if selected.any():
+                taken[selected] = piece[indices[selected] - bounds[number]]
+        return taken
+
+    @staticmethod
+    def _to_binary(_y, dtype: str = 'float32', sparse: bool = False, top=None) -> tuple:
         """
         This function can convert:
         [0, 3, 5, 6, 9, 4, 9] -> [[1, 0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 1, 0, 0, 0, 0, 0]] (binarized)
+        [0, 3, 5, 6, 9, 4, 9] -> [0, 3, 5, 6, 9, 4, 9]                                     (sparse)
         [5.67, 0.92, 0.12, 6.32] -> [0.8, 0.1, 0.12, 1]                                     (normalized)
             Untouched:
         [0.8, 0.1, 0.3, 0.1, 0.8] -> [0.8, 0.1, 0.3, 0.1, 0.8]
             Error:
         []              -> ValueError
         Object (false): -> ValueError
+        The conversion is vectorized over the whole array and returns the labels (in the given dtype) and the number
+        of classes (or columns) of the labels; None for single-output regression. The maximum label can be forced with
+        'top' when the labels are encoded by parts.
         """
         try:
-            __y = np.array(_y)
-            if len(__y.shape) == 2:
-                return _y
-            if not _y:
+            __y = np.asarray(_y)
+            if __y.ndim >= 2:
+                return __y.astype(dtype, copy=False), __y.shape[-1]
+            if not __y.size:
                 raise ValueError(f'BaseNetDatabaseError: The value of y is not provided.')
-            else:
-
-                my = max(__y)
-                if __y.dtype != int:
-                    if my > 1:
-                        return (__y / my).tolist()
-                    else:
-                        return _y
+            my = __y.max() if top is None else top
+            if not np.issubdtype(__y.dtype, np.integer):
+                if my > 1:
+                    return (__y / my).astype(dtype, copy=False), None
                 else:
-                    y = list()
-                    for element in _y:
-                        element_y = np.zeros(my + 1)
-                        element_y[element] = 1
-                        y.append(element_y)
-            return y
+                    return __y.astype(dtype, copy=False), None
+            n_classes = int(my) + 1
+            if sparse:
+                return __y.astype(dtype, copy=False), n_classes
+            y = np.zeros((len(__y), n_classes), dtype=dtype)
+            y[np.arange(len(__y)), __y] = 1
+            return y, n_classes
         except Exception as ex:
             raise RuntimeError('BaseNetDatabase:_to_binary: An error ocurred while converting the non-binzarized and'
                                f' non-normalized labels into the API database:\n{ex}')
 
+    @staticmethod
+    def _route(sizes: tuple, count: int, distribution: tuple, rng: np.random.Generator) -> np.ndarray:
+        # This function assigns 'count' incoming rows to train (0), validation (1) and test (2) so that the sizes
+        # keep following the distribution, with the same rounding as _splitdb. The assignment is shuffled.
+        total = sum(sizes) + count
+        ntrain = round(total * distribution[0] / 100)
+        nval = round(total * distribution[1] / 100)
+        quotas = np.maximum(np.array([ntrain, nval, total - ntrain - nval]) - np.array(sizes), 0)
+        excess = quotas.sum() - count
+        for split in np.argsort(-quotas):
+            taken = min(excess, quotas[split]) if excess > 0 else 0
+            quotas[split] -= taken
+            excess -= taken
+        quotas[0] -= min(excess, 0)
+        routes = np.repeat(np.arange(3, dtype=np.int8), quotas)
+        rng.shuffle(routes)
+        return routes
+
+    @staticmethod
+    def _stream_chunks(source, y_hint, chunk_rows: int, x_dtype: (str, None)):
+        # This function yields typed (x, y) arrays from DataFrames, dictionaries or tuples of a stream.
+        if isinstance(source, pd.DataFrame):
+            frame = source
+            source = (frame.iloc[start:start + chunk_rows] for start in range(0, len(frame), chunk_rows))
+        for chunk in source:
+            if isinstance(chunk, pd.DataFrame):
+                y_column = chunk.columns[-1] if y_hint is None else y_hint
+                _x = chunk.drop(columns=[y_column]).to_numpy(dtype=x_dtype)
+                _y = chunk[y_column].to_numpy()
+            elif isinstance(chunk, dict):
+                y_h = ('x', 'y') if y_hint is None else y_hint
+                _x, _y = np.asarray(chunk[y_h[0]], dtype=x_dtype), np.asarray(chunk[y_h[1]])
+            else:
+                _x, _y = np.asarray(chunk[0], dtype=x_dtype), np.asarray(chunk[1])
+            if len(_x) != len(_y):
+                raise ValueError(f'BaseNetDatabase: The number of instances of x and y must be the same in every '
+                                 f'batch. Found x: {len(_x)} != y: {len(_y)}.')
+            yield _x, _y
+
     @staticmethod
     def _framework_convertion(x, y_hint=None):
         if isinstance(x, pd.DataFrame):
@@ -546,6 +1764,34 @@ class BaseNetDatabase:
             raise ValueError('BaseNetDatabase Error: The values of y are not provided and the input x is not '
                              'recognized as a compatible framework.')
 
+    def __getstate__(self):
+        # The append buffers are not pickled (nor shared by copies): the arrays are views of them. Neither is the shared
+        # memory of load_many, its arrays keep it mapped.
+        state = dict(self.__dict__)
+        state.pop('_buffers', None)
+        state.pop('_arena', None)
+        return state
+
+    def __getattr__(self, item):
+        # Only called when the attribute is missing: joins the pending segments of a merged array, once.
+        segments = self.__dict__.get('_segments', dict())
+        if item in __array_names__ and item in segments:
+            pieces = segments[item]
+            joined = pieces[0] if len(pieces) == 1 else _concatenate(pieces)
+            self.__dict__['_segments'] = {name: value for name, value in segments.items() if name != item}
+            self.__dict__[item] = joined
+            return joined
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{item}'")
+
+    def __setattr__(self, key, value):
+        if key in __array_names__ and key in self.__dict__.get('_segments', dict()):
+            self.__dict__['_segments'] = {name: _ for name, _ in self.__dict__['_segments'].items() if name != key}
+        if key in __array_names__ or key in ('mapping', 'rescale'):
+            self.__dict__.pop('_fingerprint', None)
+        if key in __array_names__ or key == 'rescale':
+            self.__dict__.pop('_statistics', None)
+        object.__setattr__(self, key, value)
+
     def __bool__(self):
         return self.is_valid
 
@@ -583,16 +1829,519 @@ class BaseNetDatabase:
         if isinstance(other, BaseNetDatabase):
             if self and other:
                 if self.size == other.size:
-                    cs_train = (self.xtrain.size == other.xtrain.size) and (self.ytrain.size == other.ytrain.size)
-                    cs_val = (self.xval.size == other.xval.size) and (self.yval.size == other.yval.size)
-                    cs_test = (self.xtest.size == other.xtest.size) and (self.ytest.size == other.ytest.size)
-                    if cs_test and cs_val and cs_train:
-                        c_train = (self.xtrain == other.xtrain).all() and (self.ytrain == other.ytrain).all()
-                        c_val = (self.xval == other.xval).all() and (self.yval == other.yval).all()
-                        c_test = (self.xtest == other.xtest).all() and (self.ytest == other.ytest).all()
-                        if c_test and c_val and c_train:
-                            return True
+                    return self.fingerprint() == other.fingerprint()
         return False
+
+
+# -----------------------------------------------------------
+class BaseNetDatabaseView(BaseNetDatabase):
+    """
+    The BaseNetDatabaseView class is a BaseNetDatabase that does not own its data. It holds, for each of its train,
+    validation and test datasets, an index array into one of the datasets of a parent BaseNetDatabase; the rows are
+    gathered from the parent only when an array is accessed.
+
+    Views are built by BaseNetDatabase.kfold() and can be used wherever a BaseNetDatabase is accepted
+    (BaseNetModel.add_database, BaseNetLMSE.link_database...).
+    """
+    _cache_statistics = False
+
+    def __init__(self, parent: BaseNetDatabase, indices: dict, name: str = None):
+        """
+        This class builds a view of a BaseNetDatabase.
+        :param parent: The BaseNetDatabase that owns the data.
+        :param indices: A dictionary with the 'train', 'val' and 'test' keys. Each value is a tuple with the source
+        dataset of the parent ('train', 'val' or 'test') and an index array, or None to take the whole source dataset.
+        :param name: The view name. The default is the parent name.
+        """
+        self.__version__ = __version__
+        if isinstance(parent, BaseNetDatabaseView):
+            # Views of views point straight to the data owner.
+            indices = {split: parent._compose(*source) for split, source in indices.items()}
+            parent = parent.parent
+        self.parent = parent
+        self._indices = indices
+        self.name = parent.name if name is None else name
+        self.dtype = parent.dtype
+        self.shape = parent.shape
+        self.mapping = parent.mapping
+        self.n_classes = getattr(parent, 'n_classes', None)
+        self.sparse_labels = getattr(parent, 'sparse_labels', False)
+        self.rescale = getattr(parent, 'rescale', 1.0)
+        self.normalization = getattr(parent, 'normalization', None)
+        self.batch_size = parent.batch_size
+        self.seed = getattr(parent, 'seed', None)
+        self.size = (self._length('xtrain'), self._length('xval'), self._length('xtest'))
+        total = sum(self.size)
+        self.distribution = tuple(100 * _ / total for _ in self.size) if total else (0, 0, 0)
+        self.is_valid = False
+        self._check_validation()
+
+    def _compose(self, split: str, index: (np.ndarray, None)):
+        source, own = self._indices[split]
+        if own is None:
+            return source, index
+        if index is None:
+            return source, own
+        return source, own[index]
+
+    def fingerprint(self) -> str:
+        """
+        The fingerprint of a view is the fingerprint of the data it gathers, so a view and a BaseNetDatabase with the
+        same data are equal. It is cached until the parent changes. See BaseNetDatabase.fingerprint().
+        :return: The fingerprint as a hexadecimal string.
+        """
+        if any(self._owns(array_name) for array_name in __array_names__):
+            return super().fingerprint()
+        parent, cached = self.__dict__.get('_view_fingerprint', (None, None))
+        if parent != self.parent.fingerprint():
+            cached = self._content_hash()
+            self.__dict__['_view_fingerprint'] = (self.parent.fingerprint(), cached)
+        return cached
+
+    def _owns(self, array_name: str) -> bool:
+        # Arrays assigned or merged into the view are owned by the view itself.
+        return array_name in self.__dict__ or array_name in self.__dict__.get('_segments', dict())
+
+    def _pieces(self, array_name: str) -> list:
+        if self._owns(array_name):
+            return super()._pieces(array_name)
+        return [getattr(self, array_name)]
+
+    def _rows(self, array_name: str, start: int, stop: int) -> np.ndarray:
+        # Only the rows of the range are gathered from the parent, not the whole array.
+        if self._owns(array_name):
+            return super()._rows(array_name, start, stop)
+        source, index = self._indices[array_name[1:]]
+        if index is None:
+            return self.parent._rows(f'{array_name[0]}{source}', start, stop)
+        return self.parent._take(f'{array_name[0]}{source}', index[start:stop])
+
+    def _length(self, array_name: str) -> int:
+        if self._owns(array_name):
+            return super()._length(array_name)
+        source, index = self._indices[array_name[1:]]
+        if index is None:
+            return self.parent._length(f'{array_name[0]}{source}')
+        return len(index)
+
+    def _ragged(self, array_name: str) -> bool:
+        if self._owns(array_name):
+            return super()._ragged(array_name)
+        return self.parent._ragged(f'{array_name[0]}{self._indices[array_name[1:]][0]}')
+
+    def _take(self, array_name: str, indices: np.ndarray) -> np.ndarray:
+        if self._owns(array_name):
+            return super()._take(array_name, indices)
+        source, index = self._compose(array_name[1:], indices)
+        return self.parent._take(f'{array_name[0]}{source}', index)
+
+    def __getattr__(self, item):
+        indices = self.__dict__.get('_indices', dict())
+        if item in self.__dict__.get('_segments', dict()):
+            return super().__getattr__(item)
+        if item in __array_names__ and item[1:] in indices:
+            source, index = indices[item[1:]]
+            if index is None:
+                return getattr(self.parent, f'{item[0]}{source}')
+            return self.parent._take(f'{item[0]}{source}', index)
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{item}'")
+
+    def __repr__(self):
+        return f'BaseNetDatabaseView with {sum(self.size)} instances of {self.parent}'
+
+
+# -----------------------------------------------------------
+class BaseNetRaggedArray:
+    """
+    The BaseNetRaggedArray class stores a list of variable-length sequences without padding: the steps of all the
+    sequences are concatenated in a flat array (values) and the sequence i is values[offsets[i]:offsets[i + 1]].
+
+    It behaves as the rectangular arrays of a BaseNetDatabase: len(), shape (with None as the length of the
+    sequences), dtype, slicing (as a view) and integer or boolean indexing (gathering the steps in a single pass).
+    """
+    def __init__(self, values: np.ndarray, offsets: np.ndarray):
+        """
+        This class builds a ragged array from its flat values and offsets.
+        :param values: The steps of all the sequences, concatenated along the first axis.
+        :param offsets: The start of each sequence in values, followed by the total number of steps.
+        """
+        self.values = values
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @staticmethod
+    def from_sequences(sequences, dtype: str = None):
+        """
+        This function builds a ragged array from a sequence of sequences.
+        :param sequences: The variable-length sequences (lists or np.ndarrays with the same step shape).
+        :param dtype: Data type of the values. The default is the data type of the sequences.
+        :return: The BaseNetRaggedArray.
+        """
+        if isinstance(sequences, BaseNetRaggedArray):
+            return sequences if dtype is None else sequences.astype(dtype)
+        sequences = [np.asarray(sequence, dtype=dtype) for sequence in sequences]
+        offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+        np.cumsum([len(sequence) for sequence in sequences], out=offsets[1:])
+        if sequences:
+            values = np.concatenate(sequences, axis=0)
+        else:
+            values = np.empty((0,), dtype=dtype or np.float64)
+        return BaseNetRaggedArray(values, offsets)
+
+    @staticmethod
+    def concatenate(arrays: list):
+        """
+        This function joins ragged arrays, one after the other.
+        :param arrays: The list of BaseNetRaggedArray.
+        :return: The joined BaseNetRaggedArray.
+        """
+        arrays = [BaseNetRaggedArray.from_sequences(array) for array in arrays]
+        values = np.concatenate([array.values[array.offsets[0]:array.offsets[-1]] for array in arrays], axis=0)
+        lengths = np.concatenate([array.lengths for array in arrays])
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return BaseNetRaggedArray(values, offsets)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def shape(self) -> tuple:
+        return (len(self), None) + self.values.shape[1:]
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    @property
+    def nbytes(self) -> int:
+        return self.values[self.offsets[0]:self.offsets[-1]].nbytes + self.offsets.nbytes
+
+    def astype(self, dtype):
+        return BaseNetRaggedArray(self.values.astype(dtype), self.offsets)
+
+    def pad(self, length: int = None, value=0) -> np.ndarray:
+        """
+        This method pads the sequences into a rectangular array.
+        :param length: Length of the padded sequences. The default is the length of the longest sequence.
+        :param value: The padding value.
+        :return: A np.ndarray with shape (sequences, length, *step shape). Longer sequences are truncated.
+        """
+        lengths = self.lengths
+        length = int(lengths.max(initial=0)) if length is None else length
+        padded = np.full((len(self), length) + self.values.shape[1:], value, dtype=self.values.dtype)
+        kept = np.minimum(lengths, length)
+        rows = np.repeat(np.arange(len(self)), kept)
+        columns = np.arange(len(rows)) - np.repeat(np.cumsum(kept) - kept, kept)
+        padded[rows, columns] = self.values[np.repeat(self.offsets[:-1], kept) + columns]
+        return padded
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            item = range(len(self))[item]
+            return self.values[self.offsets[item]:self.offsets[item + 1]]
+        if isinstance(item, slice) and item.step in (None, 1):
+            start, stop, _ = item.indices(len(self))
+            stop = max(start, stop)
+            offsets = self.offsets[start:stop + 1]
+            return BaseNetRaggedArray(self.values[offsets[0]:offsets[-1]], offsets - offsets[0])
+        indices = np.arange(len(self))[item]
+        lengths = self.offsets[indices + 1] - self.offsets[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        steps = np.arange(offsets[-1]) + np.repeat(self.offsets[indices] - offsets[:-1], lengths)
+        return BaseNetRaggedArray(self.values[steps], offsets)
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield self[number]
+
+    def __eq__(self, other):
+        if isinstance(other, BaseNetRaggedArray):
+            return np.array_equal(self.lengths, other.lengths) and np.array_equal(
+                self.values[self.offsets[0]:self.offsets[-1]], other.values[other.offsets[0]:other.offsets[-1]])
+        return False
+
+    def __repr__(self):
+        return f'BaseNetRaggedArray with {len(self)} sequences of {self.values.shape[1:]} {self.dtype} steps'
+
+
+def _decode(x, dtype: str, rescale: float = 1.0, normalization: dict = None):
+    # This function decodes a batch of inputs: the rescale and the normalization are fused in one affine transform,
+    # x * factor + offset, applied in place to the cast copy. Sparse and ragged inputs only transform their values.
+    x = x if _is_compressed(x) else np.asarray(x)
+    if x.dtype == dtype and rescale == 1 and normalization is None:
+        return x
+    decoded = x.astype(dtype)
+    values = decoded.data if _issparse(decoded) else getattr(decoded, 'values', decoded)
+    if normalization is None:
+        if rescale != 1:
+            np.divide(values, rescale, out=values, casting='unsafe')
+        return decoded
+    factor = 1 / (rescale * normalization['scale'])
+    offset = -normalization['shift'] / normalization['scale']
+    if _issparse(decoded):
+        decoded = scipy_sparse.csr_matrix(decoded)
+        decoded.data *= factor[decoded.indices].astype(decoded.dtype, copy=False)
+        return decoded
+    # The parameters broadcast along the trailing axes holding the features (padded ragged batches have a step axis):
+    start = next((axis for axis in range(1, values.ndim + 1) if np.prod(values.shape[axis:]) == factor.size), 1)
+    row_shape = values.shape[start:]
+    np.multiply(values, factor.reshape(row_shape).astype(values.dtype, copy=False), out=values, casting='unsafe')
+    np.add(values, offset.reshape(row_shape).astype(values.dtype, copy=False), out=values, casting='unsafe')
+    return decoded
+
+
+def _issparse(x) -> bool:
+    return scipy_sparse is not None and scipy_sparse.issparse(x)
+
+
+def _is_compressed(x) -> bool:
+    # Sparse matrices and ragged arrays are stored as several flat arrays instead of one rectangular array.
+    return isinstance(x, BaseNetRaggedArray) or _issparse(x)
+
+
+def _concatenate(pieces: list):
+    # This function joins the segments of an array, stacking them as a CSR matrix if any of them is sparse.
+    if any(isinstance(piece, BaseNetRaggedArray) for piece in pieces):
+        return BaseNetRaggedArray.concatenate(pieces)
+    if any(_issparse(piece) for piece in pieces):
+        return scipy_sparse.vstack(pieces, format='csr')
+    return np.concatenate(pieces, axis=0)
+
+
+def _canonical(pieces: list):
+    # This function joins sparse segments into a CSR matrix without duplicated and with sorted indices, and ragged
+    # segments into a BaseNetRaggedArray whose offsets start at 0.
+    if any(isinstance(piece, BaseNetRaggedArray) for piece in pieces):
+        return BaseNetRaggedArray.concatenate(pieces)
+    matrix = pieces[0].tocsr() if len(pieces) == 1 else _concatenate(pieces)
+    if not matrix.has_canonical_format:
+        matrix = matrix.copy()
+        matrix.sum_duplicates()
+    return matrix
+
+
+class _ClassSampler:
+    """
+    Iterable of batch indices drawn by class. The indices of the dataset are kept grouped by class (a single integer
+    array with the start and count of each class); one epoch draws the classes of all the instances and an
+    instance of each drawn class with two vectorized draws.
+    """
+    def __init__(self, database: BaseNetDatabase, split: str, strata: np.ndarray, probabilities: np.ndarray,
+                 batch_size: int, samples: int, seed: (int, np.random.Generator, None) = None):
+        self.database = database
+        self.split = split
+        self.batch_size = batch_size
+        self.samples = samples
+        self.probabilities = probabilities
+        self.counts = np.bincount(strata, minlength=len(probabilities))
+        self.starts = np.cumsum(self.counts) - self.counts
+        index_dtype = np.int32 if len(strata) < np.iinfo(np.int32).max else np.int64
+        self.grouped = np.argsort(strata, kind='stable').astype(index_dtype)
+        self._rng = np.random.default_rng(seed)
+
+    def __iter__(self):
+        classes = self._rng.choice(len(self.probabilities), size=self.samples, p=self.probabilities)
+        offsets = (self._rng.random(self.samples) * self.counts[classes]).astype(np.int64)
+        indices = self.grouped[self.starts[classes] + offsets]
+        for start in range(0, self.samples, self.batch_size):
+            yield indices[start:start + self.batch_size]
+
+    def __len__(self):
+        return -(-self.samples // self.batch_size)
+
+
+class _LengthBuckets:
+    """
+    Iterable of batch indices where every batch comes from a single bucket of sequence lengths. One epoch shuffles the
+    indices inside their buckets (a random permutation grouped by bucket) and then the order of the batches.
+    """
+    def __init__(self, database: BaseNetDatabase, split: str, bucket_ids: np.ndarray, batch_size: int,
+                 seed: (int, np.random.Generator, None) = None):
+        self.database = database
+        self.split = split
+        self.batch_size = batch_size
+        self.bucket_ids = bucket_ids
+        self.counts = np.bincount(bucket_ids) if len(bucket_ids) else np.zeros(0, dtype=np.int64)
+        self._rng = np.random.default_rng(seed)
+
+    def __iter__(self):
+        permutation, grouping, _ = BaseNetDatabase._stratified_order(self.bucket_ids, self._rng)
+        order = permutation[grouping]
+        starts = np.cumsum(self.counts) - self.counts
+        batches = [(start, min(start + self.batch_size, bucket_start + count))
+                   for bucket_start, count in zip(starts, self.counts)
+                   for start in range(bucket_start, bucket_start + count, self.batch_size)]
+        for number in self._rng.permutation(len(batches)):
+            start, stop = batches[number]
+            yield order[start:stop]
+
+    def __len__(self):
+        return int(np.sum(-(-self.counts // self.batch_size)))
+
+
+class _RunningStatistics:
+    """
+    Mergeable per-feature statistics (count, mean, M2, min, max) of the inputs and per-output sums of the labels.
+    Chunks are combined with Chan's parallel update of Welford's algorithm. The input statistics of ragged sequences
+    are computed over their steps, counted apart from the instances.
+    """
+    def __init__(self, features: int, outputs: int, sparse: bool = False):
+        self.count = 0
+        self.steps = 0
+        self.mean = np.zeros(features)
+        self.m2 = np.zeros(features)
+        self.min = np.full(features, np.inf)
+        self.max = np.full(features, -np.inf)
+        self.y_sum = np.zeros(outputs)
+        self.sparse = sparse
+
+    def update(self, x: np.ndarray, y: np.ndarray):
+        count = x.shape[0]
+        if not count:
+            return self
+        chunk = _RunningStatistics(0, 0, self.sparse)
+        chunk.count = count
+        if isinstance(x, BaseNetRaggedArray):
+            x = x.values
+        if _issparse(x):
+            # Sparse chunks only visit their non-zero values.
+            x = scipy_sparse.csr_matrix(x, dtype=np.float64)
+            mean = np.asarray(x.mean(axis=0)).reshape(-1)
+            squares = np.asarray(x.multiply(x).sum(axis=0)).reshape(-1)
+            chunk.steps, chunk.mean, chunk.m2 = x.shape[0], mean, np.maximum(squares - x.shape[0] * mean ** 2, 0)
+            chunk.min, chunk.max = x.min(axis=0).toarray().reshape(-1), x.max(axis=0).toarray().reshape(-1)
+        else:
+            x = np.asarray(x, dtype=np.float64).reshape(x.shape[0], -1)
+            chunk.steps = x.shape[0]
+            if chunk.steps:
+                mean = x.mean(axis=0)
+                chunk.mean, chunk.m2 = mean, ((x - mean) ** 2).sum(axis=0)
+                chunk.min, chunk.max = x.min(axis=0), x.max(axis=0)
+        if self.sparse:
+            chunk.y_sum = np.bincount(np.asarray(y, dtype=np.int64), minlength=len(self.y_sum))
+        else:
+            chunk.y_sum = np.asarray(y, dtype=np.float64).reshape(count, -1).sum(axis=0)
+        merged = self.merge(chunk)
+        self.__dict__.update(merged.__dict__)
+        return self
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        if not self.count:
+            return other
+        merged = _RunningStatistics(0, 0, self.sparse)
+        merged.count = self.count + other.count
+        merged.y_sum = self.y_sum + other.y_sum
+        if not other.steps or not self.steps:
+            source = self if self.steps else other
+            merged.steps, merged.mean, merged.m2 = source.steps, source.mean, source.m2
+            merged.min, merged.max = source.min, source.max
+            return merged
+        merged.steps = self.steps + other.steps
+        delta = other.mean - self.mean
+        merged.mean = self.mean + delta * other.steps / merged.steps
+        merged.m2 = self.m2 + other.m2 + delta ** 2 * self.steps * other.steps / merged.steps
+        merged.min = np.minimum(self.min, other.min)
+        merged.max = np.maximum(self.max, other.max)
+        return merged
+
+    def report(self) -> dict:
+        count, steps = max(self.count, 1), max(self.steps, 1)
+        return {'count': self.count, 'mean': self.mean, 'variance': self.m2 / steps,
+                'std': np.sqrt(self.m2 / steps), 'min': self.min, 'max': self.max, 'class_count': self.y_sum,
+                'balance': 100 * self.y_sum / count}
+
+    def to_dict(self, features: bool = True) -> dict:
+        # The per-feature statistics are left out with features=False; the container saves them as raw blocks.
+        values = {'count': self.count, 'steps': self.steps, 'y_sum': self.y_sum.tolist(), 'sparse': self.sparse}
+        if features:
+            values.update({part: getattr(self, part).tolist() for part in __statistics_parts__})
+        return values
+
+    @staticmethod
+    def from_dict(values: dict):
+        running = _RunningStatistics(0, 0, values['sparse'])
+        running.count = values['count']
+        running.steps = values.get('steps', values['count'])
+        for key in ('mean', 'm2', 'min', 'max', 'y_sum'):
+            setattr(running, key, np.array(values[key], dtype=np.float64))
+        return running
+
+
+class _SharedArena(shared_memory.SharedMemory):
+    """
+    Shared memory block holding the arrays of a database built by BaseNetDatabase.load_many. The arrays are views of
+    the block: while any of them is alive the block cannot be closed, and it is unmapped with the last of them.
+    """
+    def __del__(self):
+        try:
+            self.close()
+        except (OSError, BufferError):
+            pass
+
+
+def _read_into(path: str, arena_name: str, jobs: dict, arrays: dict):
+    # This function runs in the processes of BaseNetDatabase.load_many: it reads the blocks of one file into their
+    # place of the shared block, straight from the file when the data types match and casting them otherwise.
+    arena = shared_memory.SharedMemory(name=arena_name)
+    try:
+        with open(path, 'rb') as file:
+            for array_name, (offset, dtype, shape, start, stop) in jobs.items():
+                base, target_dtype, target_shape = arrays[array_name]
+                row_bytes = target_dtype.itemsize * int(np.prod(target_shape[1:]))
+                begin, end = base + start * row_bytes, base + stop * row_bytes
+                file.seek(offset)
+                if np.dtype(dtype) == target_dtype:
+                    while begin < end:
+                        with arena.buf[begin:min(end, begin + __checksum_chunk__)] as chunk:
+                            read = file.readinto(chunk)
+                        if not read:
+                            raise EOFError(f'BaseNetDatabase: {path} is truncated.')
+                        begin += read
+                elif stop > start:
+                    block = np.fromfile(file, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+                    with arena.buf[begin:end] as chunk:
+                        np.frombuffer(chunk, dtype=target_dtype).reshape(block.shape)[...] = block
+    finally:
+        arena.close()
+
+
+class _GrowableBuffer:
+    """
+    Typed array of rows with amortized appends: the capacity is doubled when it runs out.
+    """
+    def __init__(self, row_shape: tuple, dtype, capacity: int = 1024):
+        self.data = np.empty((max(capacity, 1),) + tuple(row_shape), dtype=dtype)
+        self.length = 0
+
+    def extend(self, rows: np.ndarray):
+        needed = self.length + len(rows)
+        if needed > len(self.data):
+            grown = np.empty((max(needed, 2 * len(self.data)),) + self.data.shape[1:], dtype=self.data.dtype)
+            grown[:self.length] = self.data[:self.length]
+            self.data = grown
+        self.data[self.length:needed] = rows
+        self.length = needed
+        return self
+
+    def view(self) -> np.ndarray:
+        return self.data[:self.length]
+
+    def trim(self) -> np.ndarray:
+        # Releases the unused capacity in place. No views of the buffer must be alive.
+        self.data.resize((self.length,) + self.data.shape[1:], refcheck=False)
+        return self.data
+
+    def __len__(self):
+        return self.length
+
+
 # - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
 #                        END OF FILE                        #
 # - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
@@ -27,7 +27,7 @@ from ..__special import Subkeras, Sublosses
 from .._names import KERAS_LIST_LAYERS, PREBUILT_LOSSES, PREBUILT_LAYERS
 from ..__special__ import __keras_checkpoint__, __tensorboard_logs__, __print_model_path__, __bypass_path__, __version__
 
-from ..database import BaseNetDatabase
+from ..database import BaseNetDatabase, BaseNetRaggedArray
 
 
 # -----------------------------------------------------------
@@ -122,13 +122,24 @@ class BaseNetModel:
             self.summary = ex
             logging.error(f'BaseNetModel:Raised the following exception: {ex}.')
 
-    def fit(self, ndb: int = -1, epochs: int = 10, tensorboard: bool = True, avoid_lock: bool = False):
+    def fit(self, ndb: int = -1, epochs: int = 10, tensorboard: bool = True, avoid_lock: bool = False,
+            sampler=None, augmentation: list = None, workers: int = None):
         """
         This function fits the BaseNetModel with the selected database.
         :param ndb: Index of the database already loaded. The default is the last database.
         :param epochs: Number of epochs to train. It is 10 by default.
         :param tensorboard: Activates or deactivates the Tensorboard.
         :param avoid_lock: Avoids the training process to lock the parent process.
+        :param sampler: A sampler built with BaseNetDatabase.sampler() (i.e. class-balanced) or
+        BaseNetDatabase.buckets(). If given, the training batches are drawn by the sampler from its database instead of
+        iterating the train dataset in order. Databases of ragged sequences are bucketed by length by default.
+        :param augmentation: A list of Keras preprocessing layers (RandomFlip, RandomRotation...) or functions of
+        (x, y) tensors returning (x, y). They are applied to the train batches in the input pipeline, on parallel CPU
+        threads, instead of inside the model. The stage attached to the database with BaseNetDatabase.augment() is
+        applied as well.
+        :param workers: Number of CPU threads gathering, decoding and augmenting (BaseNetDatabase.augment()) the batches
+        drawn by the database: with a sampler, an augmentation stage or ragged sequences. The default is the number of
+        CPUs.
         :return: BaseNetResults of the fitting process.
         """
         if tensorboard:
@@ -146,10 +157,9 @@ class BaseNetModel:
                                 'database does not exist.')
             return None
 
-        xtrain = db.xtrain
-        ytrain = db.ytrain
-        xval = db.xval
-        yval = db.yval
+        if sampler is None and db._ragged('xtrain'):
+            # Variable-length sequences are batched by length buckets and padded per batch.
+            sampler = db.buckets('train')
 
         __history__ = None
         fit_callback = _FitCallback()
@@ -160,23 +170,15 @@ class BaseNetModel:
                 keras.models.save_model(self.model, __bypass_path__)
                 self.model = None
                 queue = Queue()
-                p = Process(target=self._fit_in_other_process, args=((xtrain, ytrain), (xval, yval),
-                                                                     epochs, db.batch_size, self.name, queue, db.dtype,
-                                                                     (self._stop_queue, self._recover_queue)))
+                p = Process(target=self._fit_in_other_process, args=(db, epochs, self.name, queue,
+                                                                     (self._stop_queue, self._recover_queue),
+                                                                     sampler, augmentation, workers))
                 p.start()
                 __history__ = BaseNetResults(queue=queue, parent=p)
             else:
 
-                # Auto shard options. Avoid console-vomiting in TF 2.0.
-                options = tf.data.Options()
-                options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
                 # Re-formatting the database.
-                _xtrain = tf.convert_to_tensor(xtrain, dtype=getattr(tf, db.dtype[0]))
-                _ytrain = tf.convert_to_tensor(ytrain, dtype=getattr(tf, db.dtype[1]))
-                _xval = tf.convert_to_tensor(xval, dtype=getattr(tf, db.dtype[0]))
-                _yval = tf.convert_to_tensor(yval, dtype=getattr(tf, db.dtype[1]))
-                trai = tf.data.Dataset.from_tensor_slices((_xtrain, _ytrain)).batch(db.batch_size).with_options(options)
-                val = tf.data.Dataset.from_tensor_slices((_xval, _yval)).batch(db.batch_size).with_options(options)
+                trai, val = self._pipelines(db, sampler, augmentation, workers)
 
                 history = self.model.fit(trai, batch_size=db.batch_size, epochs=epochs,
                                          validation_data=val,
@@ -196,7 +198,8 @@ class BaseNetModel:
         finally:
             return __history__
 
-    def predict(self, x, scale: float = 1.0, th: (None, float) = None, expand_dims: bool = False) -> tf.Tensor:
+    def predict(self, x, scale: float = 1.0, th: (None, float) = None, expand_dims: bool = False,
+                ndb: int = None) -> tf.Tensor:
         """
         This function predicts with the current model an output from the input 'x', divided by the 'scale' and converted
         to a binary matrix with a custom threshold 'th'.
@@ -205,9 +208,14 @@ class BaseNetModel:
         :param th: Custom output threshold (default: 0.5 -> mid-range predictions). Set up to 'None' to see
         the real output.
         :param expand_dims: Expands the dimension of the tensor.
+        :param ndb: Index of a loaded database. If given, 'x' is preprocessed as its inputs (rescale and normalization,
+        see BaseNetDatabase.normalize) instead of being divided by the 'scale'.
         :return: The prediction output of the model.
         """
-        _x_ = tf.convert_to_tensor(np.array(x).astype("float32") / scale)
+        if ndb is not None:
+            _x_ = tf.convert_to_tensor(self.breech[ndb].decode(np.asarray(x)))
+        else:
+            _x_ = tf.convert_to_tensor(np.array(x).astype("float32") / scale)
         if expand_dims:
             __x = tf.expand_dims(_x_, axis=-1)
         else:
@@ -234,7 +242,10 @@ class BaseNetModel:
                 logging.warning('BaseNetModel: Cannot load the BaseNetDatabase to evaluate, '
                                 'the index of the database does not exist.')
             return None
-        xtest = tf.convert_to_tensor(db.xtest, dtype=getattr(tf, db.dtype[0]))
+        xtest = db.decode(db.xtest)
+        if isinstance(xtest, BaseNetRaggedArray):
+            xtest = xtest.pad()
+        xtest = tf.convert_to_tensor(xtest, dtype=getattr(tf, db.dtype[0]))
         ytest = tf.convert_to_tensor(db.ytest, dtype=getattr(tf, db.dtype[1]))
         _output_ = self.predict(xtest, th=th)
         result = metric(_output_, ytest)
@@ -573,20 +584,13 @@ class BaseNetModel:
             os.remove(flush_checkpoints)
 
     @staticmethod
-    def _fit_in_other_process(train, val, epochs: int, batch_size: int, name: str, queue: Queue,
-                              dtype: tuple[str, str], stop_queues):
+    def _fit_in_other_process(db: BaseNetDatabase, epochs: int, name: str, queue: Queue, stop_queues, sampler=None,
+                              augmentation: list = None, workers: int = None):
         print('Joined other process for training.')
         model = keras.models.load_model(__bypass_path__)
-        # Auto shard options. Avoid console-vomiting in TF 2.0.
-        _xtrain = tf.convert_to_tensor(train[0], dtype=getattr(tf, dtype[0]))
-        _ytrain = tf.convert_to_tensor(train[1], dtype=getattr(tf, dtype[1]))
-        _xval = tf.convert_to_tensor(val[0], dtype=getattr(tf, dtype[0]))
-        _yval = tf.convert_to_tensor(val[1], dtype=getattr(tf, dtype[1]))
-        options = tf.data.Options()
-        options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+        batch_size = db.batch_size
         # Re-formatting the database.
-        train = tf.data.Dataset.from_tensor_slices((_xtrain, _ytrain)).batch(batch_size).with_options(options)
-        val = tf.data.Dataset.from_tensor_slices((_xval, _yval)).batch(batch_size).with_options(options)
+        train, val = BaseNetModel._pipelines(db, sampler, augmentation, workers)
 
         stop_callback = _ForceStopCallback(queue=stop_queues[0])
         fit_callback = _FitCallback(queue=queue)
@@ -602,6 +606,80 @@ class BaseNetModel:
         keras.models.save_model(model, __bypass_path__)
         stop_queues[1].put('SAVED')
 
+    @staticmethod
+    def _pipelines(db: BaseNetDatabase, sampler=None, augmentation: list = None, workers: int = None) -> tuple:
+        # The train and validation datasets of the fit. The arrays are sliced as tensors unless the batches must be
+        # drawn (sampler), augmented in NumPy (BaseNetDatabase.augment) or padded (ragged sequences) by the database.
+        rescale = getattr(db, 'rescale', 1.0)
+        normalization = getattr(db, 'normalization', None)
+        if sampler is not None or getattr(db, '_augmentation', None):
+            train = BaseNetModel._sampled_pipeline(db, sampler, split='train', workers=workers)
+        else:
+            train = BaseNetModel._input_pipeline((db.xtrain, db.ytrain), db.batch_size, db.dtype, rescale,
+                                                  normalization)
+        if augmentation:
+            train = BaseNetModel._augmented_pipeline(train, augmentation)
+        if db._ragged('xval'):
+            val = BaseNetModel._sampled_pipeline(db, split='val', workers=workers)
+        else:
+            val = BaseNetModel._input_pipeline((db.xval, db.yval), db.batch_size, db.dtype, rescale,
+                                                normalization)
+        return train, val
+
+    @staticmethod
+    def _augmented_pipeline(dataset: tf.data.Dataset, augmentation: list) -> tf.data.Dataset:
+        # Keras preprocessing layers run in training mode; the batches are augmented on the tf.data CPU threads.
+        def augment(x, y):
+            for transform in augmentation:
+                if isinstance(transform, keras.layers.Layer):
+                    x = transform(x, training=True)
+                else:
+                    x, y = transform(x, y)
+            return x, y
+        return dataset.map(augment, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+    @staticmethod
+    def _input_pipeline(data: tuple, batch_size: int, dtype: tuple[str, str], rescale: float = 1.0,
+                        normalization: dict = None) -> tf.data.Dataset:
+        # Auto shard options. Avoid console-vomiting in TF 2.0.
+        options = tf.data.Options()
+        options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+        x, y = data
+        x_dtype = getattr(tf, dtype[0])
+        _y = tf.convert_to_tensor(y, dtype=getattr(tf, dtype[1]))
+        if np.asarray(x).dtype == dtype[0] and rescale == 1 and normalization is None:
+            _x = tf.convert_to_tensor(x, dtype=x_dtype)
+            return tf.data.Dataset.from_tensor_slices((_x, _y)).batch(batch_size).with_options(options)
+        # Compact or normalized databases: the inputs stay as stored and are decoded per batch, with the rescale and
+        # the normalization fused in a single multiply-add.
+        factor, offset = np.float32(1 / rescale), np.float32(0)
+        if normalization is not None:
+            row_shape = np.asarray(x).shape[1:]
+            factor = (1 / (rescale * normalization['scale'])).reshape(row_shape).astype(np.float32)
+            offset = (-normalization['shift'] / normalization['scale']).reshape(row_shape).astype(np.float32)
+        _x = tf.convert_to_tensor(x)
+        dataset = tf.data.Dataset.from_tensor_slices((_x, _y)).batch(batch_size)
+        dataset = dataset.map(lambda bx, by: (tf.cast(tf.cast(bx, tf.float32) * factor + offset, x_dtype), by),
+                              num_parallel_calls=tf.data.AUTOTUNE)
+        return dataset.with_options(options)
+
+    @staticmethod
+    def _sampled_pipeline(db: BaseNetDatabase, sampler=None, split: str = 'val',
+                          workers: int = None) -> tf.data.Dataset:
+        # The sampler draws new indices on every epoch from its own database; without sampler the split is streamed
+        # (shuffled if it is the train dataset). The batches are gathered (decoded, padded and augmented) by the
+        # database on a pool of CPU threads.
+        db = db if sampler is None else sampler.database
+        workers = (os.cpu_count() or 1) if workers is None else workers
+        options = tf.data.Options()
+        options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+        signature = (tf.TensorSpec((None, *db.shape[0]), dtype=getattr(tf, db.dtype[0])),
+                     tf.TensorSpec((None, *db.shape[1]), dtype=getattr(tf, db.dtype[1])))
+        dataset = tf.data.Dataset.from_generator(lambda: db.batches(split, shuffle=split == 'train', sampler=sampler,
+                                                                    prefetch=2 * workers, workers=workers),
+                                                 output_signature=signature)
+        return dataset.prefetch(tf.data.AUTOTUNE).with_options(options)
+
     # Build functions:
     def __repr__(self):
         return f'Model object with the following parameters:\nCompiler: {self.compiler}\nSummary: {self.summary}'
@@ -8,12 +8,16 @@
 import tensorflow as tf
 from tensorflow.python.client import device_lib
 from ..deeplearning import BaseNetModel
+from ..database import BaseNetDatabase
 
 
 # -----------------------------------------------------------
 # TODO
 class BaseNetDeployment:
     def __init__(self, models: list[BaseNetModel], preprocess=None, posprocess=None):
+        if isinstance(preprocess, BaseNetDatabase):
+            # The inputs are preprocessed as the database ones: rescale and normalization (see preprocessing()).
+            preprocess = preprocess.preprocessing()
         self.preprocess = preprocess
         self.posprocess = posprocess
         self.models = {model.name: model for model in models}
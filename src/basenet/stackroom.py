@@ -7,10 +7,19 @@
 # Import statements:
 import logging
 import os
+import json
 import yaml
 import shutil
+import copy
+import threading
 import numpy as np
-from .database import BaseNetDatabase
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from scipy import sparse as scipy_sparse
+except ImportError:
+    scipy_sparse = None
+from .database import BaseNetDatabase, BaseNetRaggedArray
 from .__special__ import __version__
 
 INITIALIZE_CATEGORICAL = {'class_count': list(), 'class_balance': dict(), 'is_categorical': True,
@@ -20,9 +29,12 @@ INITIALIZE_NON_CATEGORICAL = {'statistical_count': list(), 'statistical_balance'
 
 
 __config_file__ = 'info.yaml'
+__manifest_file__ = 'manifest.json'
 __storage_dir__ = 'stackroom'
 __test_dir__ = 'tests'
 __model_dir__ = 'models'
+__shard_caches__ = dict()
+__shard_caches_lock__ = threading.Lock()
 
 
 # - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
@@ -30,12 +42,29 @@ __model_dir__ = 'models'
 # - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
 class BaseNetStackRoom:
     def __init__(self, room_path: str, batch_size: int = None, patch_size: float = None,
-                 name: str = 'default_bnsr_name', categorical: bool = False):
+                 name: str = 'default_bnsr_name', categorical: bool = False, prefetch: int = 0,
+                 prefetch_mb: float = None, cache_mb: float = 0):
         """
+        This class builds (or opens) a BaseNetStackRoom in room_path.
+        :param room_path: The directory of the StackRoom.
+        :param batch_size: The batch size of the stored databases. The default is the one of the first database.
+        :param patch_size: The maximum size of a shard, in MB. The default is the size of the first database.
+        :param name: The StackRoom name.
+        :param categorical: If True, the labels of the stored databases are categorical.
+        :param prefetch: Number of shards loaded ahead by get(), in background threads, following the round-robin order.
+        :param prefetch_mb: Maximum size, in MB, of the shards loaded ahead. The default has no limit.
+        :param cache_mb: Size, in MB, of the LRU cache of loaded shards. The cache is shared by all the StackRooms of
+        the process opened on the same room_path (the largest size given is used); 0 does not use it.
         """
         self.__version__ = __version__
         self.room_path = room_path
+        self.prefetch = prefetch
+        self.prefetch_mb = prefetch_mb
+        self.__executor = None
+        self.__pending = {'train': dict(), 'test': dict()}
+        self.__cache = _ShardCache.shared(room_path, cache_mb) if cache_mb else None
         self.__info_path = f'{room_path}/{__config_file__}'
+        self.__manifest_path = f'{room_path}/{__manifest_file__}'
         self.current_index_train = 0
         self.current_index_test = 0
         self.__is_built = False
@@ -46,6 +75,7 @@ class BaseNetStackRoom:
             with open(self.__info_path, 'r', encoding='utf-8') as file:
                 self.config = yaml.load(file, yaml.Loader)
                 self.__is_built = True
+            self.manifest = self.__load_manifest()
         else:
             if categorical:
                 self.database_info = INITIALIZE_CATEGORICAL
@@ -55,38 +85,81 @@ class BaseNetStackRoom:
                            'size': {'train': (0, 0, 0), 'test': (0, 0, 0)},
                            'database_data_type': tuple(), 'database_shape': tuple(), 'number_of_databases': 0,
                            'database_information': self.database_info, 'current_sizes_mb': dict(), 'current_size_mb': 0}
+            self.manifest = {'version': 1, 'train': list(), 'test': list()}
             self.update_info()
 
     def get(self, train: bool = True):
         if not self.__is_built:
             logging.error('BaseNetStackRoom: Unable to access data because the current StackRoom is not created yet.')
             return None
+        if not self.manifest['train' if train else 'test']:
+            logging.error(f'BaseNetStackRoom: Unable to load a database because the StackRoom has no '
+                          f'{"train" if train else "test"} databases.')
+            return None
+        # The shard is looked up in the manifest: its id is its position.
         if train:
-            all_ones = os.listdir(f'{self.room_path}/{__storage_dir__}')
-            dbsel = None
-            for _ in all_ones:
-                if int(_.split('_')[0]) == self.current_index_train:
-                    dbsel = _
-                    break
-            db = BaseNetDatabase.load(f'{self.room_path}/{__storage_dir__}/{dbsel}')
-            if self.current_index_train >= len(all_ones) - 1:
+            shards = self.manifest['train']
+            db = self.__read('train', self.current_index_train)
+            if self.current_index_train >= len(shards) - 1:
                 self.current_index_train = 0
             else:
                 self.current_index_train += 1
+            self.__prefetch('train', self.current_index_train)
         else:
-            all_ones = os.listdir(f'{self.room_path}/{__test_dir__}')
-            dbsel = None
-            for _ in all_ones:
-                if int(_.split('_')[0]) == self.current_index_test:
-                    dbsel = _
-                    break
-            db = BaseNetDatabase.load(f'{self.room_path}/{__storage_dir__}/{dbsel}')
-            if self.current_index_test >= len(all_ones) - 1:
+            shards = self.manifest['test']
+            db = self.__read('test', self.current_index_test)
+            if self.current_index_test >= len(shards) - 1:
                 self.current_index_test = 0
             else:
                 self.current_index_test += 1
+            self.__prefetch('test', self.current_index_test)
         return db
 
+    def sampler(self, train: bool = True, batch_size: int = None, buffer_size: int = None,
+                seed: (int, np.random.Generator, None) = None):
+        """
+        This method builds a globally shuffled sampler over the shards of the StackRoom. Every iteration over the
+        sampler is one epoch of (x, y) batches drawn from a permutation of all the (shard, row) pairs of the manifest:
+        each batch only reads its own rows, from memory-mapped shards, so no shard is loaded as a whole:
+
+            for xbatch, ybatch in my_room.sampler(seed=0):
+                ...
+
+        Shards that cannot be memory-mapped (legacy pickled shards or sparse inputs) are streamed instead: they are
+        loaded one by one in random order and their rows are drawn at random from a shuffle buffer.
+        :param train: If True, the train datasets of the train shards are sampled; if not, the test shards.
+        :param batch_size: The batch size. The default is the batch_size of the StackRoom.
+        :param buffer_size: The number of rows of the shuffle buffer. The default is the size of the largest shard.
+        :param seed: Seed or np.random.Generator used to shuffle.
+        :return: The sampler, an iterable of (x, y) batches.
+        """
+        if not self.__is_built:
+            logging.error('BaseNetStackRoom: Unable to access data because the current StackRoom is not created yet.')
+            return None
+        return _ShardSampler(self.room_path, self.manifest['train' if train else 'test'], 'train' if train else 'test',
+                             self.config['batch_size'] if batch_size is None else batch_size, buffer_size, seed)
+
+    def cache_info(self) -> (dict, None):
+        """
+        This method reports the shard cache shared by the StackRooms of this room_path.
+        :return: A dictionary with the 'hits', 'misses', 'evictions', 'entries', 'bytes' and 'capacity' (bytes) of the
+        cache; or None if this StackRoom does not use it.
+        """
+        return None if self.__cache is None else self.__cache.info()
+
+    def close(self):
+        """
+        This method stops the background loading of shards and releases the shards loaded ahead.
+        :return: Nothing.
+        """
+        for pending in self.__pending.values():
+            for future in pending.values():
+                future.cancel()
+            pending.clear()
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+
     def report(self, all_info: bool = True) -> str:
         __text__ = f'<BaseNetStackRoom Report>\n\n' \
                    f'\t[!] Database attributes:\n' \
@@ -114,12 +187,17 @@ class BaseNetStackRoom:
         return f'{__text__}{_info_}'
 
     def update_info(self):
-        with open(self.__info_path, 'w', encoding='utf-8') as file:
+        # Both files are replaced atomically, so a reader never sees a partial config or manifest.
+        with open(f'{self.__info_path}.tmp', 'w', encoding='utf-8') as file:
             yaml.dump(self.config, file, default_flow_style=False, encoding='utf-8')
+        os.replace(f'{self.__info_path}.tmp', self.__info_path)
+        with open(f'{self.__manifest_path}.tmp', 'w', encoding='utf-8') as file:
+            json.dump(self.manifest, file)
+        os.replace(f'{self.__manifest_path}.tmp', self.__manifest_path)
 
     def add_database(self, database: BaseNetDatabase, train: bool = True):
         if train:
-            if database.xtest:
+            if len(database.xtest):
                 database.xtrain = np.concatenate([database.xtrain, database.xtest])
                 database.ytrain = np.concatenate([database.ytrain, database.ytest])
             database.xtest = np.array([database.xtrain[0]])
@@ -132,12 +210,12 @@ class BaseNetStackRoom:
             if not ret_value and self.config['number_of_databases'] == 0:
                 shutil.rmtree(f'{self.room_path}')
         else:
-            if database.xtrain:
+            if len(database.xtrain):
                 database.xtest = np.concatenate([database.xtest, database.xtrain])
                 database.ytest = np.concatenate([database.ytest, database.ytrain])
             database.ytrain = np.array([database.ytest[0]])
             database.xtrain = np.array([database.xtest[0]])
-            if database.xval:
+            if len(database.xval):
                 database.xtest = np.concatenate([database.xtest, database.xval])
                 database.ytest = np.concatenate([database.ytest, database.yval])
             database.xval = np.array([database.xtest[0]])
@@ -151,13 +229,15 @@ class BaseNetStackRoom:
         return ret_value
 
     def __add_database_test(self, database: BaseNetDatabase):
-        if self.__compute_patch_size(database) > self.config['patch_size']:
+        if self.__compute_patch_size(database, f'{len(self.manifest["test"])}_{database.name}') > \
+                self.config['patch_size']:
             logging.error('BaseNetStackRoom: Cannot import the database because it exceeds the patch size.')
             return False
         else:
-            nod = len(os.listdir(f'{self.room_path}/{__test_dir__}'))
+            nod = len(self.manifest['test'])
             database.name = f'{nod}_{database.name}'
             database.save(f'{self.room_path}/{__test_dir__}/{database.name}.db')
+            self.__register(f'{__test_dir__}/{database.name}.db', train=False)
             return True
 
     def __add_database_train(self, database: BaseNetDatabase):
@@ -174,7 +254,7 @@ class BaseNetStackRoom:
                 database.batch_size = self.config['batch_size']
             if self.config['name'] is None:
                 self.config['name'] = database.name
-            initial_current_size = self.__compute_patch_size(database)
+            initial_current_size = self.__compute_patch_size(database, f'0_{database.name}')
             if self.config['patch_size'] is None:
                 self.config['patch_size'] = initial_current_size
             else:
@@ -192,7 +272,9 @@ class BaseNetStackRoom:
                 self.config['database_information']['fuzzy_map'] = {'ranges': database.mapping[0][0],
                                                                     'labels': database.mapping[0][1]}
         else:
-            size_cond = self.config['patch_size'] >= self.__compute_patch_size(database)
+            database.batch_size = self.config['batch_size']
+            size_cond = self.config['patch_size'] >= \
+                self.__compute_patch_size(database, f'{self.config["number_of_databases"]}_{database.name}')
             type_cond = self.config['database_data_type'] == database.dtype
             shape_cond = self.config['database_shape'] == database.shape
             cat_cond = self.config['database_information']['is_categorical'] == database.mapping[1]
@@ -214,44 +296,105 @@ class BaseNetStackRoom:
         # Compute class balance or statistical balance:
         database.batch_size = self.config['batch_size']
         database.name = f'{self.config["number_of_databases"]}_{database.name}'
-        balance = {'name': database.name, 'train': 100 * np.mean(database.ytrain, axis=0),
-                   'val': 100 * np.mean(database.yval, axis=0), 'test': 100 * np.mean(database.ytest, axis=0),
-                   'size': database.size}
-        if database.mapping[1]:
-            self.config['database_information']['class_count'].append(balance)
-            _bal = {'train': np.mean(np.array([_['train'] for _ in self.config['database_information']['class_count']]),
-                                     axis=0),
-                    'val': np.mean(np.array([_['val'] for _ in self.config['database_information']['class_count']]),
-                                   axis=0),
-                    'test': np.mean(np.array([_['test'] for _ in self.config['database_information']['class_count']]),
-                                    axis=0)}
-            self.config['database_information']['class_balance'] = _bal
-        else:
-            self.config['database_information']['statistical_count'].append(balance)
-
-            _ba = {'train': np.mean(np.array([_['train'] for _ in
-                                              self.config['database_information']['statistical_count']]), axis=0),
-                   'val': np.mean(np.array([_['val'] for _ in
-                                            self.config['database_information']['statistical_count']]), axis=0),
-                   'test': np.mean(np.array([_['test'] for _ in
-                                             self.config['database_information']['statistical_count']]), axis=0)}
-            self.config['database_information']['statistical_count'] = _ba
+        balance = {'name': database.name, 'size': database.size,
+                   **{split: database.statistics(split)['balance'] for split in ('train', 'val', 'test')}}
+        count_key, balance_key = ('class_count', 'class_balance') if database.mapping[1] else \
+            ('statistical_count', 'statistical_balance')
+        counts = self.config['database_information'][count_key]
+        counts.append(balance)
+        # Running mean over the imported databases, so the cost does not grow with the room:
+        previous = self.config['database_information'].get(balance_key) or dict()
+        self.config['database_information'][balance_key] = {
+            split: balance[split] if split not in previous or len(counts) == 1 else
+            previous[split] + (balance[split] - previous[split]) / len(counts) for split in ('train', 'val', 'test')}
         self.config['number_of_databases'] += 1
 
         # Save the database and compute the size:
         database.save(f'{self.room_path}/{__storage_dir__}/{database.name}.db')
-        current_size = os.path.getsize(f'{self.room_path}/{__storage_dir__}/{database.name}.db') / 1_000_000
+        current_size = self.__register(f'{__storage_dir__}/{database.name}.db') / 1_000_000
         self.config['current_sizes_mb'][database.name] = current_size
         self.config['current_size_mb'] += current_size
         self.__is_built = True
         return True
 
+    def __read(self, split: str, index: int) -> BaseNetDatabase:
+        # This function returns a shard, from the background loads if it was loaded ahead.
+        future = self.__pending[split].pop(index, None)
+        if future is not None and not future.cancelled():
+            return future.result()
+        return self.__load(split, index)
+
+    def __load(self, split: str, index: int) -> BaseNetDatabase:
+        # This function loads a shard, through the shared cache if there is one. The cached shards are keyed by their
+        # fingerprint too, so a rebuilt room never returns stale data.
+        shard = self.manifest[split][index]
+        path = f'{self.room_path}/{shard["file"]}'
+        if self.__cache is None:
+            return BaseNetDatabase.load(path)
+        return self.__cache.get((split, index, shard.get('fingerprint')), shard['bytes'],
+                                lambda: BaseNetDatabase.load(path))
+
+    def __prefetch(self, split: str, start: int):
+        # This function loads ahead the next shards of the round-robin order, within the memory budget. The loads that
+        # fall out of the window (i.e. the current index was moved) are dropped.
+        shards = self.manifest[split]
+        window, budget = list(), 0
+        for index in dict.fromkeys((start + step) % len(shards) for step in range(min(self.prefetch, len(shards)))):
+            budget += shards[index]['bytes']
+            if self.prefetch_mb is not None and budget > self.prefetch_mb * 1_000_000:
+                break
+            window.append(index)
+        pending = self.__pending[split]
+        for index in [index for index in pending if index not in window]:
+            pending.pop(index).cancel()
+        if window and self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=max(self.prefetch, 1))
+        for index in window:
+            if index not in pending:
+                pending[index] = self.__executor.submit(self.__load, split, index)
+
+    def __register(self, file: str, train: bool = True) -> int:
+        # This function appends a saved shard to the manifest: id, file, bytes, sizes and checksums. Only the header
+        # of the shard is read.
+        shards = self.manifest['train' if train else 'test']
+        header = BaseNetDatabase.inspect(f'{self.room_path}/{file}')
+        shard = {'id': len(shards), 'file': file, 'bytes': os.path.getsize(f'{self.room_path}/{file}'),
+                 'size': list(header['size']), 'checksum': header.get('checksum'),
+                 'fingerprint': header.get('fingerprint'),
+                 'mappable': header.get('checksum') is not None and
+                 all(entry.get('format') != 'csr' for entry in header['arrays'].values())}
+        shards.append(shard)
+        return shard['bytes']
+
+    def __load_manifest(self) -> dict:
+        # This function loads the manifest. Rooms built before the manifest existed are indexed once from their files.
+        if os.path.exists(self.__manifest_path):
+            with open(self.__manifest_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        self.manifest = {'version': 1, 'train': list(), 'test': list()}
+        for directory, train in ((__storage_dir__, True), (__test_dir__, False)):
+            files = os.listdir(f'{self.room_path}/{directory}') if os.path.exists(f'{self.room_path}/{directory}') \
+                else list()
+            for file in sorted(files, key=lambda _: int(_.split('_')[0])):
+                self.__register(f'{directory}/{file}', train=train)
+        self.update_info()
+        return self.manifest
+
     @staticmethod
-    def __compute_patch_size(database: BaseNetDatabase) -> float:
-        database.save('./.tmp.db')
-        size = os.path.getsize('./.tmp.db') / 1_000_000
-        os.remove('./.tmp.db')
-        return size
+    def __compute_patch_size(database: BaseNetDatabase, name: str) -> float:
+        # The size is computed from the layout of the arrays, nothing is written. It is computed on the state that is
+        # saved: the shard name and the statistics of every split, that are saved with the shard. The exact size of
+        # the shard is recorded in the manifest once it is saved.
+        for split in ('train', 'val', 'test'):
+            database.statistics(split)
+        original_name, database.name = database.name, name
+        try:
+            return database.saved_size() / 1_000_000
+        finally:
+            database.name = original_name
+
+    def __del__(self):
+        self.close()
 
     def __repr__(self):
         _header = f'\n|===========================================|\n' \
@@ -265,6 +408,227 @@ class BaseNetStackRoom:
                 f'|\t\t\t\t\t\t\t\t\t\t\t|\n'
         _end = f'|===========================================|\n'
         return f"{_header}{_info}{_end}"
+
+
+class _ShardCache:
+    """
+    Thread-safe LRU cache of loaded shards, capped by bytes (the size of the shard files in the manifest). There is
+    one cache per room_path in the process, as large as the largest size requested. The arrays of the cached
+    databases are read-only and the databases are returned as copies with their own attributes, so a StackRoom cannot
+    change the shards read by the others: appending to a copy copies its arrays first and writing into them raises.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def shared(room_path: str, cache_mb: float):
+        with __shard_caches_lock__:
+            key = os.path.realpath(room_path)
+            if key not in __shard_caches__:
+                __shard_caches__[key] = _ShardCache(0)
+            cache = __shard_caches__[key]
+        cache.resize(int(cache_mb * 1_000_000))
+        return cache
+
+    def get(self, key: tuple, nbytes: int, loader):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._copy(self._entries[key][0])
+            self.misses += 1
+        # The shard is loaded out of the lock, so other shards can be served meanwhile.
+        database = loader()
+        if database is not None and nbytes <= self.capacity:
+            _freeze(database)
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = (database, nbytes)
+                    self.nbytes += nbytes
+                    self._evict()
+        return None if database is None else self._copy(database)
+
+    def resize(self, capacity: int):
+        # The cache never shrinks below the size requested by another StackRoom.
+        with self._lock:
+            self.capacity = max(self.capacity, capacity)
+            self._evict()
+
+    def info(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'bytes': self.nbytes, 'capacity': self.capacity}
+
+    @staticmethod
+    def _copy(database: BaseNetDatabase) -> BaseNetDatabase:
+        # Shallow copy of a database whose dictionaries (segments, buffers, statistics...) are its own.
+        duplicate = copy.copy(database)
+        for name, value in database.__dict__.items():
+            if isinstance(value, dict):
+                duplicate.__dict__[name] = dict(value)
+        return duplicate
+
+    def _evict(self):
+        while self.nbytes > self.capacity and self._entries:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.nbytes -= nbytes
+            self.evictions += 1
+
+
+class _ShardSampler:
+    """
+    Iterable of (x, y) batches drawn across the shards of a StackRoom. One epoch is a permutation of the global row
+    numbers of the shards (their start is the running sum of the shard sizes in the manifest); the rows of each batch
+    are grouped by shard and gathered from the memory-mapped shards. If any shard cannot be mapped, the shards are
+    streamed in random order through a shuffle buffer instead.
+    """
+    def __init__(self, room_path: str, shards: list, split: str, batch_size: int, buffer_size: int = None,
+                 seed: (int, np.random.Generator, None) = None):
+        self.room_path = room_path
+        self.shards = shards
+        self.split = split
+        self.batch_size = batch_size
+        column = 0 if split == 'train' else 2
+        self.counts = np.array([shard['size'][column] for shard in shards], dtype=np.int64)
+        self.ends = np.cumsum(self.counts)
+        self.mappable = all(shard.get('mappable', shard.get('checksum') is not None) for shard in shards)
+        self.buffer_size = int(self.counts.max(initial=1)) if buffer_size is None else buffer_size
+        self._mapped = dict()
+        self._rng = np.random.default_rng(seed)
+
+    def __iter__(self):
+        if self.mappable:
+            return self.__mapped_epoch()
+        return self.__streamed_epoch()
+
+    def __len__(self):
+        return -(-int(self.ends[-1] if len(self.ends) else 0) // self.batch_size)
+
+    def __mapped_epoch(self):
+        order = self._rng.permutation(int(self.ends[-1]) if len(self.ends) else 0)
+        for start in range(0, len(order), self.batch_size):
+            index = order[start:start + self.batch_size]
+            shard_ids = np.searchsorted(self.ends, index, side='right')
+            rows = index - (self.ends - self.counts)[shard_ids]
+            grouping = np.argsort(shard_ids, kind='stable')
+            numbers, counts = np.unique(shard_ids[grouping], return_counts=True)
+            parts = [self.__shard(int(number)).gather(self.split, group) for number, group in
+                     zip(numbers, np.split(rows[grouping], np.cumsum(counts)[:-1]))]
+            yield _stack([x for x, _ in parts]), np.concatenate([y for _, y in parts])
+
+    def __streamed_epoch(self):
+        buffer = _ShuffleBuffer(max(self.buffer_size, self.batch_size))
+        for number in self._rng.permutation(len(self.shards)):
+            database = BaseNetDatabase.load(f'{self.room_path}/{self.shards[number]["file"]}')
+            x, y = database.gather(self.split, np.arange(database.size[('train', 'val', 'test').index(self.split)]))
+            del database
+            stored = 0
+            while stored < y.shape[0]:
+                stored += buffer.put(x[stored:], y[stored:])
+                while buffer.full():
+                    yield buffer.draw(self.batch_size, self._rng)
+        while len(buffer):
+            yield buffer.draw(min(self.batch_size, len(buffer)), self._rng)
+
+    def __shard(self, number: int) -> BaseNetDatabase:
+        # The shards are mapped once per sampler; their pages are read on demand.
+        if number not in self._mapped:
+            self._mapped[number] = BaseNetDatabase.load(f'{self.room_path}/{self.shards[number]["file"]}', mmap=True)
+        return self._mapped[number]
+
+
+class _ShuffleBuffer:
+    """
+    Fixed-size buffer of (x, y) rows. The rows of a batch are drawn at random and their slots are filled with the last
+    rows of the buffer, so drawing a batch moves only batch-size rows. Sparse rows are kept as single-row matrices and
+    padded sequences are padded again when a longer one arrives.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.filled = 0
+        self.x = None
+        self.y = None
+
+    def put(self, x, y) -> int:
+        # Stores the first rows that fit in the buffer and returns how many.
+        count = min(self.capacity - self.filled, y.shape[0])
+        if self.x is None:
+            self.y = np.empty((self.capacity,) + y.shape[1:], dtype=y.dtype)
+            self.x = np.empty(self.capacity, dtype=object) if _issparse(x) else \
+                np.zeros((self.capacity,) + x.shape[1:], dtype=x.dtype)
+        if _issparse(x):
+            for number in range(count):
+                self.x[self.filled + number] = x[number]
+        else:
+            if x.shape[1:] != self.x.shape[1:]:
+                shape = np.maximum(x.shape[1:], self.x.shape[1:])
+                self.x, x = _pad_to(self.x, shape), _pad_to(x[:count], shape)
+            self.x[self.filled:self.filled + count] = x[:count]
+        self.y[self.filled:self.filled + count] = y[:count]
+        self.filled += count
+        return count
+
+    def draw(self, count: int, rng: np.random.Generator) -> tuple:
+        drawn = rng.choice(self.filled, count, replace=False)
+        x = scipy_sparse.vstack(list(self.x[drawn]), format='csr') if self.x.dtype == object else self.x[drawn]
+        batch = (x, self.y[drawn])
+        # The drawn slots before the new end are filled with the rows after it that were not drawn:
+        end = self.filled - count
+        holes = drawn[drawn < end]
+        tail = np.setdiff1d(np.arange(end, self.filled), drawn, assume_unique=True)
+        self.x[holes], self.y[holes] = self.x[tail], self.y[tail]
+        self.x[end:self.filled] = 0 if self.x.dtype != object else None
+        self.filled = end
+        return batch
+
+    def full(self) -> bool:
+        return self.filled == self.capacity
+
+    def __len__(self):
+        return self.filled
+
+
+def _freeze(database: BaseNetDatabase):
+    # This function makes the arrays of a database read-only: plain, ragged (values and offsets) and sparse arrays.
+    pending = list(database.__dict__.values())
+    while pending:
+        value = pending.pop()
+        if isinstance(value, np.ndarray):
+            value.setflags(write=False)
+        elif isinstance(value, (list, tuple)):
+            pending.extend(value)
+        elif isinstance(value, dict):
+            pending.extend(value.values())
+        elif isinstance(value, BaseNetRaggedArray):
+            pending.extend((value.values, value.offsets))
+        elif _issparse(value):
+            pending.extend((value.data, value.indices, value.indptr))
+
+
+def _issparse(x) -> bool:
+    return scipy_sparse is not None and scipy_sparse.issparse(x)
+
+
+def _pad_to(x: np.ndarray, shape) -> np.ndarray:
+    # This function pads the rows of x with zeros up to the given row shape.
+    return np.pad(x, [(0, 0)] + [(0, int(size) - current) for size, current in zip(shape, x.shape[1:])])
+
+
+def _stack(parts: list):
+    # This function joins the inputs of a batch read from several shards. Padded sequences are padded again to the
+    # longest one, and sparse inputs are stacked as a CSR matrix.
+    if _issparse(parts[0]):
+        return scipy_sparse.vstack(parts, format='csr')
+    if len({part.shape[1:] for part in parts}) > 1:
+        length = max(part.shape[1] for part in parts)
+        parts = [np.pad(part, [(0, 0), (0, length - part.shape[1])] + [(0, 0)] * (part.ndim - 2)) for part in parts]
+    return np.concatenate(parts)
 # - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
 #                        END OF FILE                        #
 # - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
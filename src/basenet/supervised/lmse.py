@@ -7,6 +7,11 @@
 # Import statements:
 import numpy as np
 from ..database import BaseNetDatabase
+try:
+    from scipy import sparse as scipy_sparse
+    from scipy.sparse.linalg import lsqr
+except ImportError:
+    scipy_sparse = None
 
 
 class BaseNetLMSE:
@@ -41,7 +46,8 @@ class BaseNetLMSE:
 
         * link_database: Use this method to link a BaseNetDatabase to the model.
         * fit: Use this method to train the model. If a BaseNetDatabase is provided to the constructor, the fitting
-          process and validation are automatic.
+          process and validation are automatic. Sparse inputs are fitted with an iterative least squares solver (LSQR),
+          so the cost scales with the non-zero values.
         * validate: Computes the 'mse', 'mae' and 'error' of the validation dataset. If a BaseNetDatabase is provided to
           the constructor, the fitting process and validation are automatic.
         * predict: Takes a sample as input and predicts the output with the trained values.
@@ -70,7 +76,7 @@ class BaseNetLMSE:
     def link_database(self, input_database: (BaseNetDatabase, str)):
         """
         This method links a BaseNetDatabase to the model.
-        :param input_database: The input BaseNetDatabase or a path where it is saved.
+        :param input_database: The input BaseNetDatabase (or BaseNetDatabaseView) or a path where it is saved.
         :return: The object of the method.
         """
         if isinstance(input_database, str):
@@ -80,7 +86,7 @@ class BaseNetLMSE:
         else:
             raise TypeError('BaseNetLMSE:The input database to the LSTM is not a path or BaseNetDatabase.')
         self.linked_database = database
-        self.__shape = database.xtrain.shape[1:]
+        self.__shape = tuple(database.shape[0])
         return self
 
     def fit(self):
@@ -94,12 +100,14 @@ class BaseNetLMSE:
         else:
             raise RuntimeError('BaseNetLMSE: Tried to train the model without a linked database. '
                                'Link a database with the "link_database()" method.')
-        xtrain = self.__utility_conversion(database.xtrain)
+        # Views (i.e. k-fold) gather their rows here, once.
+        _xtrain = database.decode(database.xtrain)
+        xtrain = self.__utility_conversion(_xtrain)
         ytrain = database.ytrain
         # Train the matrix.
         v = self.__train_matrix(xtrain, ytrain)
         # Weights and shape.
-        _shape = [shape for shape in database.xtrain.shape[1:]]
+        _shape = [shape for shape in _xtrain.shape[1:]]
         if _shape[-1] == 1:
             _shape.pop()
         _shape.append(ytrain.shape[-1])
@@ -122,7 +130,7 @@ class BaseNetLMSE:
             RuntimeError('BaseNetLMSE: Tried a validation without a trained model. Link a database with the'
                          '"link_database()" method and train it with the "fit()" method.')
         # Data extraction.
-        xtest = database.xval
+        xtest = database.decode(database.xval)
         ytest = database.yval
         # Validation.
         ytest_hat = self.predict(xtest, th)
@@ -137,13 +145,13 @@ class BaseNetLMSE:
     def predict(self, x: (list, tuple, np.ndarray), th: (None, float) = None):
         """
         This method predicts the outputs using the current model weights.
-        :param x: A list, tuple, structured array of inputs.
+        :param x: A list, tuple, structured array or scipy.sparse matrix of inputs.
         :param th: The threshold in the output, if provided.
-        :return: A list, tuple, structured array with the predicted values.
+        :return: A list, tuple, structured array with the predicted values (an array for sparse inputs).
         """
-        main_type = type(x)
-        x_ = self.__utility_conversion(np.array(x))
-        ytest_hat_float = np.matmul(x_, self.weights)
+        main_type = np.ndarray if self.__issparse(x) else type(x)
+        x_ = self.__utility_conversion(x if self.__issparse(x) else np.array(x))
+        ytest_hat_float = np.asarray(x_ @ self.weights)
         if th is not None:
             y = self.__threshold(ytest_hat_float, th)
         elif self.th is not None:
@@ -177,7 +185,7 @@ class BaseNetLMSE:
             RuntimeError('BaseNetLMSE: Tried a test without a trained model. Link a database with the'
                          '"link_database()" method and train it with the "fit()" method.')
         # Data extraction.
-        xtest = database.xtest
+        xtest = database.decode(database.xtest)
         ytest = database.ytest
         # Validation.
         ytest_hat = self.predict(xtest, th)
@@ -253,13 +261,21 @@ class BaseNetLMSE:
             return w, b
 
     # Model functions.
+    @staticmethod
+    def __issparse(matrix) -> bool:
+        return scipy_sparse is not None and scipy_sparse.issparse(matrix)
+
     @staticmethod
     def __add_bias(matrix: np.ndarray):
+        if BaseNetLMSE.__issparse(matrix):
+            return scipy_sparse.hstack([np.ones((matrix.shape[0], 1), dtype=matrix.dtype), matrix], format='csr')
         ones_tensor = np.ones(matrix.shape[:-1])
         biasing = np.expand_dims(ones_tensor, 1)
         return np.concatenate([biasing, matrix], axis=1)
 
     def __utility_conversion(self, matrix: np.ndarray):
+        if self.__issparse(matrix):
+            return self.__add_bias(matrix)
         if matrix.shape[-1] == 1:
             train = np.squeeze(matrix, -1)
         else:
@@ -272,6 +288,12 @@ class BaseNetLMSE:
 
     @staticmethod
     def __train_matrix(x: np.ndarray, y: np.ndarray):
+        if BaseNetLMSE.__issparse(x):
+            # Minimum norm least squares solution per output, without densifying the inputs.
+            _y = np.reshape(y, (y.shape[0], -1))
+            a = np.stack([lsqr(x, _y[:, column], atol=1e-10, btol=1e-10)[0] for column in range(_y.shape[1])],
+                         axis=-1)
+            return a if y.ndim > 1 else a[:, 0]
         q_i = np.linalg.pinv(x.T)
         a = y.T @ q_i
         return a.T
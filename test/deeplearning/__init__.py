@@ -11,6 +11,7 @@ from .database import basenet_database_test
 from .compiler import basenet_compiler_test
 from .feeder import basenet_feeder_test
 from .model import basenet_model_test
+from .stackroom import basenet_stackroom_test
 # - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
 #                        END OF FILE                        #
 # - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
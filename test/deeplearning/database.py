@@ -6,9 +6,14 @@
 # - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
 # Import statements:
 from messages import do_assert, LowLevelError
-from basenet import BaseNetDatabase
+from basenet import BaseNetDatabase, BaseNetAugmentation
+import numpy as np
 import random
 import os
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
 
 IO_PATH = './my_database.db'
 
@@ -45,6 +50,112 @@ def basenet_database_test(logger, preamble):
     do_assert(_y_db.dtype, ('float32', 'int8'), LowLevelError.construction)
     do_assert(_y_db.distribution, (60, 20, 20), LowLevelError.construction)
     do_assert(_y_db.is_valid, True, LowLevelError.construction_raw)
+    do_assert(_y_db.n_classes, max(y) + 1, LowLevelError.label_encoding)
+    do_assert(_y_db.ytrain.shape, (6, max(y) + 1), LowLevelError.label_encoding)
+    _sparse_db = BaseNetDatabase(x, y, sparse_labels=True, dtype=('float', 'int'), bits=(32, 32))
+    do_assert(_sparse_db.ytrain.shape, (7,), LowLevelError.label_encoding)
+    do_assert(_sparse_db.n_classes, max(y) + 1, LowLevelError.label_encoding)
+
+    _stratified_db = BaseNetDatabase([[0.0]] * 100, [0] * 90 + [1] * 10,
+                                     distribution={'train': 60, 'val': 20, 'test': 20}, seed=0, stratify=True)
+    do_assert([int(_stratified_db.statistics(_split)['class_count'][1]) for _split in ('train', 'val', 'test')],
+              [6, 2, 2], LowLevelError.stratified_split)
+    for _strata in ([_ // 2 for _ in range(100)], [_ // 3 for _ in range(100)], [_ // 5 for _ in range(100)]):
+        _small_strata_db = BaseNetDatabase([[0.0]] * 100, _strata, distribution={'train': 70, 'val': 20, 'test': 10},
+                                           seed=0, stratify=True, sparse_labels=True)
+        do_assert(_small_strata_db.size, (70, 20, 10), LowLevelError.stratified_split)
+    _groups = np.repeat(np.arange(25), 4)
+    _grouped_db = BaseNetDatabase(np.arange(100).reshape(-1, 1), [0] * 100, seed=0, stratify=_groups,
+                                  distribution={'train': 50, 'val': 25, 'test': 25}, dtype=('int', 'int'))
+    do_assert(_grouped_db.size, (50, 25, 25), LowLevelError.stratified_split)
+    do_assert(len(np.unique(_groups[_grouped_db.xtest.reshape(-1)])), 25, LowLevelError.stratified_split)
+    _singleton_db = BaseNetDatabase([[0.0]] * 100, [0] * 100, distribution={'train': 70, 'val': 20, 'test': 10},
+                                    seed=0, stratify=np.arange(100))
+    do_assert(_singleton_db.size, (70, 20, 10), LowLevelError.stratified_split)
+    do_assert(BaseNetDatabase([[0.0]] * 10, np.linspace(0, 1, 10), stratify=True).is_valid, False,
+              LowLevelError.stratified_split)
+    _sampler = _stratified_db.sampler('train', batch_size=10, seed=0)
+    do_assert(len(_sampler), 6, LowLevelError.sampler)
+    _drawn = np.concatenate([_yb for _, _yb in _stratified_db.batches(sampler=_sampler)])
+    do_assert(len(_drawn), 60, LowLevelError.sampler)
+    do_assert(bool(abs(np.mean(np.argmax(_drawn, axis=-1)) - 0.5) < 0.2), True, LowLevelError.sampler)
+    _gapped_db = BaseNetDatabase([[0.0]] * 30, [0, 1, 3] * 10, seed=0, sparse_labels=True)
+    _gapped_draws = [_yb for _, _yb in _gapped_db.batches(sampler=_gapped_db.sampler('train', weights={3: 1.0}))]
+    do_assert(set(np.concatenate(_gapped_draws).astype(int).tolist()), {3}, LowLevelError.sampler)
+    _missing_db = BaseNetDatabase([[0.0]] * 30, [0, 1] * 14 + [2, 2], seed=0, stratify=True, batch_size=4)
+    _missing_split = [_split for _split in ('train', 'val', 'test')
+                      if not _missing_db.statistics(_split)['class_count'][2]][0]
+    _missing_sampler = _missing_db.sampler(_missing_split, weights=[1.0, 1.0, 1.0])
+    do_assert(len(_missing_sampler), -(-_missing_db.statistics(_missing_split)['count'] // 4), LowLevelError.sampler)
+    if sparse is not None:
+        _sparse_x = sparse.random(100, 50, density=0.05, format='csr', random_state=0)
+        _sparse_input_db = BaseNetDatabase(_sparse_x, [0, 1] * 50, distribution={'train': 60, 'val': 20, 'test': 20},
+                                           seed=0)
+        _dense_input_db = BaseNetDatabase(_sparse_x.toarray(), [0, 1] * 50,
+                                          distribution={'train': 60, 'val': 20, 'test': 20}, seed=0)
+        do_assert(sparse.issparse(_sparse_input_db.xtrain), True, LowLevelError.sparse_inputs)
+        do_assert(_sparse_input_db.size, _dense_input_db.size, LowLevelError.sparse_inputs)
+        do_assert(np.allclose(_sparse_input_db.xval.toarray(), _dense_input_db.xval), True, LowLevelError.sparse_inputs)
+        _sparse_halves = _sparse_input_db / 2
+        _sparse_merge = _sparse_halves[0] + _sparse_halves[1]
+        do_assert(_sparse_merge, _sparse_input_db, LowLevelError.sparse_inputs)
+    _sequences = [[[float(_step)]] * _step for _step in range(1, 41)]
+    _ragged_db = BaseNetDatabase(_sequences, [0, 1] * 20, distribution={'train': 50, 'val': 25, 'test': 25},
+                                 batch_size=4, seed=0, ragged=True)
+    do_assert(_ragged_db.shape, ((None, 1), (2,)), LowLevelError.ragged)
+    do_assert(int(_ragged_db.xtrain.lengths.sum() + _ragged_db.xval.lengths.sum() + _ragged_db.xtest.lengths.sum()),
+              820, LowLevelError.ragged)
+    _ragged_batches = list(_ragged_db.batches(sampler=_ragged_db.buckets('train', n_buckets=5, seed=0)))
+    do_assert(sum(len(_xb) for _xb, _ in _ragged_batches), 20, LowLevelError.ragged)
+    do_assert(all(_xb.shape[1] == _xb[:, :, 0].max() for _xb, _ in _ragged_batches), True, LowLevelError.ragged)
+    _ragged_fold, _ = next(_ragged_db.kfold(2, seed=0))
+    do_assert((_ragged_fold._ragged('xtrain'), _ragged_fold._ragged('xval'), _stratified_db._ragged('xtrain')),
+              (True, True, False), LowLevelError.ragged)
+    _augmented_db = BaseNetDatabase([[[0.0, 1.0, 2.0]]] * 16, [0, 1] * 8, batch_size=4, seed=0)
+    _augmented_db.augment(BaseNetAugmentation.flip(axis=2, probability=1.0))
+    _augmented_batch, _ = next(_augmented_db.batches('train', shuffle=False))
+    do_assert(_augmented_batch[0].tolist(), [[2.0, 1.0, 0.0]], LowLevelError.augmentation)
+    do_assert(_augmented_db.xtrain[0].tolist(), [[0.0, 1.0, 2.0]], LowLevelError.augmentation)
+    _val_batch, _ = next(_augmented_db.batches('val', shuffle=False))
+    do_assert(_val_batch[0].tolist(), [[0.0, 1.0, 2.0]], LowLevelError.augmentation)
+
+    _map_db = BaseNetDatabase([[0.0]] * 8, [0, 1, 2, 3] * 2)
+    _map_db.define_map(['Dog', 'Cat', 'Fox', 'Dragon'])
+    do_assert(_map_db.map([[0.8, 0.1, 0.1, 0.0], [0.0, 0.0, 0.6, 0.4]]).tolist(), ['Dog', 'Fox'],
+              LowLevelError.mapping)
+    _map_db.define_map(['False', 'Undecidable', 'True'])
+    do_assert(_map_db.map([[0.1, 0.5, 0.9]]).tolist(), [['False', 'Undecidable', 'True']], LowLevelError.mapping)
+    do_assert(len(list(_map_db.map_stream([[[0.1]], [[0.9]]]))), 2, LowLevelError.mapping)
+
+    _images = [[[random.randint(0, 255) for _ in range(4)] for _ in range(4)] for _ in range(20)]
+    _compact_db = BaseNetDatabase(np.array(_images, dtype='uint8'), [0, 1] * 10, rescale=255, compact=True, seed=0)
+    _full_db = BaseNetDatabase(np.array(_images, dtype='uint8'), [0, 1] * 10, rescale=255, seed=0)
+    do_assert(str(_compact_db.xtrain.dtype), 'uint8', LowLevelError.compact)
+    do_assert(np.allclose(_compact_db.decode(_compact_db.xtrain), _full_db.xtrain), True, LowLevelError.compact)
+    try:
+        _compact_db + BaseNetDatabase(np.array(_images, dtype='uint8'), [0, 1] * 10, rescale=2, compact=True)
+        _rescale_mismatch = False
+    except ValueError:
+        _rescale_mismatch = True
+    do_assert(_rescale_mismatch, True, LowLevelError.merge)
+    _compact_db.normalize('standard')
+    _normalized = np.concatenate([_xb for _xb, _ in _compact_db.batches('train', batch_size=4, seed=0)])
+    do_assert(np.allclose(_normalized.mean(axis=0), 0, atol=1e-5), True, LowLevelError.normalization)
+    do_assert(str(_compact_db.xtrain.dtype), 'uint8', LowLevelError.normalization)
+    _compact_db.append(np.array(_images[:2], dtype='uint8'), [0, 1], split='train')
+    do_assert(np.allclose(_compact_db.statistics('train')['mean'],
+                          _compact_db.decode(_compact_db.xtrain, normalize=False).reshape(_compact_db.size[0], -1)
+                          .mean(axis=0)), True, LowLevelError.normalization)
+    do_assert(np.allclose(_compact_db.preprocessing()(_compact_db.xval), _compact_db.decode(_compact_db.xval)), True,
+              LowLevelError.normalization)
+    _compact_db.save(f'{IO_PATH}.normalized')
+    _restored_db = BaseNetDatabase.load(f'{IO_PATH}.normalized')
+    do_assert(np.allclose(_restored_db.statistics('train')['std'], _compact_db.statistics('train')['std']), True,
+              LowLevelError.statistics)
+    do_assert(BaseNetDatabase.verify(f'{IO_PATH}.normalized'), True, LowLevelError.statistics)
+    os.remove(f'{IO_PATH}.normalized')
+    do_assert(np.allclose(_restored_db.decode(_restored_db.xtest), _compact_db.decode(_compact_db.xtest)), True,
+              LowLevelError.normalization)
 
     x, y = create_random_dataset(3, 3000)
     my_db = BaseNetDatabase(x, y,
@@ -55,10 +166,33 @@ def basenet_database_test(logger, preamble):
 
     do_assert(my_db.batch_size, 8, LowLevelError.auto_batch)
 
+    _seeded_a = BaseNetDatabase(x, y, distribution={'train': 60, 'val': 20, 'test': 20}, seed=42)
+    _seeded_b = BaseNetDatabase(x, y, distribution={'train': 60, 'val': 20, 'test': 20}, seed=42)
+    do_assert(_seeded_a, _seeded_b, LowLevelError.seeded_split)
+    do_assert(_seeded_a.size, (1800, 600, 600), LowLevelError.seeded_split)
+
     my_db.save(IO_PATH)
     if os.path.exists(IO_PATH):
         my_db_load = BaseNetDatabase.load(IO_PATH)
         do_assert(my_db, my_db_load, LowLevelError.importing)
+        my_db_mmap = BaseNetDatabase.load(IO_PATH, mmap=True)
+        do_assert(my_db, my_db_mmap, LowLevelError.mmap_importing)
+        del my_db_mmap
+        my_db_info = BaseNetDatabase.inspect(IO_PATH)
+        do_assert(my_db_info['size'], my_db.size, LowLevelError.inspection)
+        do_assert(my_db_info['shape'], my_db.shape, LowLevelError.inspection)
+        do_assert(BaseNetDatabase.verify(IO_PATH), True, LowLevelError.inspection)
+        do_assert(my_db.saved_size(), os.path.getsize(IO_PATH), LowLevelError.exporting)
+        _train_only = BaseNetDatabase(x[:100], y[:100], distribution={'train': 100, 'val': 0, 'test': 0})
+        do_assert(_train_only.save(f'{IO_PATH}.train'), True, LowLevelError.exporting)
+        do_assert(BaseNetDatabase.load(f'{IO_PATH}.train'), _train_only, LowLevelError.importing)
+        os.remove(f'{IO_PATH}.train')
+        do_assert(my_db_info['fingerprint'], my_db.fingerprint(), LowLevelError.fingerprint)
+        _seeded_a.save(f'{IO_PATH}.legacy', legacy=True)
+        my_db_many = BaseNetDatabase.load_many([IO_PATH, f'{IO_PATH}.legacy', IO_PATH], workers=2)
+        do_assert(my_db_many, my_db + _seeded_a + my_db, LowLevelError.parallel_importing)
+        del my_db_many
+        os.remove(f'{IO_PATH}.legacy')
         os.remove(IO_PATH)
     else:
         do_assert(os.path.exists(IO_PATH), True, LowLevelError.exporting)
@@ -72,6 +206,49 @@ def basenet_database_test(logger, preamble):
     do_assert(_merge, _y_db, LowLevelError.merge)
     do_assert(_merge.size, (6, 2, 2), LowLevelError.merge)
 
+    _fingerprint = _merge.fingerprint()
+    do_assert(_fingerprint, _y_db.fingerprint(), LowLevelError.fingerprint)
+    for _ in range(10):
+        _merge.append([[random.random() for _ in range(3)]], [random.randint(0, _merge.n_classes - 1)])
+    do_assert(_merge.size, (12, 4, 4), LowLevelError.append)
+    do_assert(_merge.is_valid, True, LowLevelError.append)
+    _merge.append([[0.0, 0.0, 0.0]], [0], split='test')
+    do_assert(_merge.size, (12, 4, 5), LowLevelError.append)
+    do_assert(_merge.fingerprint() == _fingerprint, False, LowLevelError.fingerprint)
+
+    _statistics = my_db.statistics('train')
+    do_assert(_statistics['count'], my_db.size[0], LowLevelError.statistics)
+    do_assert(np.allclose(_statistics['mean'], np.mean(my_db.xtrain.reshape(my_db.size[0], -1), axis=0)), True,
+              LowLevelError.statistics)
+    do_assert(np.allclose(sum(_half.statistics('train')['class_count'] for _half in my_db / 2),
+                          _statistics['class_count']), True, LowLevelError.statistics)
+
+    _batches = list(my_db.batches('train', batch_size=256, seed=0, prefetch=2, workers=2))
+    do_assert(len(_batches), 8, LowLevelError.batches)
+    do_assert(sum(len(_xb) for _xb, _ in _batches), my_db.size[0], LowLevelError.batches)
+    do_assert(_batches[0][1].shape, (256, 11), LowLevelError.batches)
+    _again = list(my_db.batches('train', batch_size=256, seed=0, prefetch=0))
+    do_assert(all(np.array_equal(_xa, _xb) for (_xa, _), (_xb, _) in zip(_again, _batches)), True,
+              LowLevelError.batches)
+    _seeded_again = list(my_db.batches('train', batch_size=256, seed=np.random.default_rng(0), prefetch=0))
+    do_assert(len(_seeded_again), len(_batches), LowLevelError.batches)
+
+    _folds = list(my_db.kfold(4, stratified=True, seed=0))
+    do_assert(len(_folds), 4, LowLevelError.kfold)
+    do_assert(_folds[0][0].size, (1350, 450, 600), LowLevelError.kfold)
+    do_assert(_folds[0][1].size, (0, 450, 450), LowLevelError.kfold)
+    do_assert(sum(len(_val.xval) for _, _val in _folds), my_db.size[0], LowLevelError.kfold)
+    _fold_x = _folds[0][0].xtrain
+    do_assert(bool(np.allclose(_folds[0][0].statistics('train', chunk_rows=100)['mean'], _fold_x.mean(axis=0))), True,
+              LowLevelError.kfold)
+
+    _stream = ((x[_:_ + 500], y[_:_ + 500]) for _ in range(0, len(x), 500))
+    _streamed_db = BaseNetDatabase.from_stream(_stream, distribution={'train': 60, 'val': 20, 'test': 20},
+                                               dtype=('float', 'int'), bits=(32, 8), seed=0)
+    do_assert(_streamed_db.size, my_db.size, LowLevelError.construction_stream)
+    do_assert(_streamed_db.shape, my_db.shape, LowLevelError.construction_stream)
+    do_assert(_streamed_db.is_valid, True, LowLevelError.construction_stream)
+
     train_x = my_db.xtrain
     train_y = my_db.ytrain
     val_x = my_db.xval
@@ -0,0 +1,113 @@
+# - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
+#                                                           #
+#   This file was created by: Alberto Palomo Alonso         #
+# Universidad de Alcalá - Escuela Politécnica Superior      #
+#                                                           #
+# - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
+# Import statements:
+from messages import do_assert, LowLevelError
+from basenet import BaseNetDatabase, BaseNetStackRoom
+import numpy as np
+import shutil
+
+ROOM_PATH = './my_stackroom'
+
+
+# -----------------------------------------------------------
+def basenet_stackroom_test(logger, preamble):
+    """
+    TEST:
+    ----------
+    BaseNetStackRoom
+    ----------
+
+    :param logger: The top level logger.
+    :param preamble: The top level message.
+    :return: Nothing.
+    """
+    # The first column of the shards is the shard number and the second one the row number, so every row is unique:
+    def create_shard(number, rows):
+        x = np.stack([np.full(rows, number), np.arange(rows)], axis=1).astype(float)
+        return BaseNetDatabase(x, np.arange(rows) % 3, distribution={'train': 60, 'val': 20, 'test': 20},
+                               name='shard', seed=number)
+
+    shutil.rmtree(ROOM_PATH, ignore_errors=True)
+    try:
+        my_room = BaseNetStackRoom(ROOM_PATH, patch_size=1, categorical=True, batch_size=16)
+        for number in range(4):
+            my_db = create_shard(number, 100)
+            my_db.define_map(['a', 'b', 'c'])
+            do_assert(my_room.add_database(my_db), True, LowLevelError.manifest)
+
+        # Manifest lookup:
+        do_assert([shard['id'] for shard in my_room.manifest['train']], [0, 1, 2, 3], LowLevelError.manifest)
+        do_assert([my_room.get().name for _ in range(5)], ['0_shard', '1_shard', '2_shard', '3_shard', '0_shard'],
+                  LowLevelError.manifest)
+        do_assert(my_room.get(train=False), None, LowLevelError.manifest)
+        my_reopened_room = BaseNetStackRoom(ROOM_PATH)
+        do_assert(my_reopened_room.manifest, my_room.manifest, LowLevelError.manifest)
+        do_assert(my_reopened_room.get().name, '0_shard', LowLevelError.manifest)
+        my_room.close()
+        my_reopened_room.close()
+
+        # Prefetch ordering: the shards loaded ahead are the next ones of the round-robin order.
+        my_prefetched_room = BaseNetStackRoom(ROOM_PATH, prefetch=2)
+        _pending = my_prefetched_room._BaseNetStackRoom__pending['train']
+        for expected in (0, 1, 2, 3, 0):
+            do_assert(my_prefetched_room.get().name, f'{expected}_shard', LowLevelError.prefetch)
+            do_assert(sorted(_pending), sorted([(expected + 1) % 4, (expected + 2) % 4]), LowLevelError.prefetch)
+        my_prefetched_room.close()
+        do_assert(len(_pending), 0, LowLevelError.prefetch)
+        my_prefetched_room = BaseNetStackRoom(ROOM_PATH, prefetch=2,
+                                              prefetch_mb=1.5 * my_room.manifest['train'][0]['bytes'] / 1_000_000)
+        my_prefetched_room.get()
+        do_assert(list(my_prefetched_room._BaseNetStackRoom__pending['train']), [1], LowLevelError.prefetch)
+        my_prefetched_room.close()
+
+        # Shard cache: room for two shards, shared by the StackRooms of the same path.
+        _cache_mb = 2.5 * my_room.manifest['train'][0]['bytes'] / 1_000_000
+        my_cached_room = BaseNetStackRoom(ROOM_PATH, cache_mb=_cache_mb)
+        for _ in range(5):
+            my_cached_room.get()
+        my_shared_room = BaseNetStackRoom(ROOM_PATH, cache_mb=_cache_mb)
+        do_assert(my_shared_room.get().name, '0_shard', LowLevelError.shard_cache)
+        _info = my_cached_room.cache_info()
+        do_assert((_info['hits'], _info['misses'], _info['evictions'], _info['entries']), (1, 5, 3, 2),
+                  LowLevelError.shard_cache)
+        do_assert(my_shared_room.cache_info(), _info, LowLevelError.shard_cache)
+        do_assert(my_room.cache_info(), None, LowLevelError.shard_cache)
+        do_assert(BaseNetStackRoom(ROOM_PATH, cache_mb=_cache_mb / 10).cache_info(), _info, LowLevelError.shard_cache)
+        _first, _second = my_cached_room.get(), my_shared_room.get()
+        do_assert((_first.name, _second.name), ('1_shard', '1_shard'), LowLevelError.shard_cache)
+        do_assert(_first.xtrain.flags.writeable, False, LowLevelError.shard_cache)
+        _first.append([[1.0, 1.0]], [0], split='train')
+        do_assert((len(_first.xtrain), len(_second.xtrain)), (_second.size[0] + 1, _second.size[0]),
+                  LowLevelError.shard_cache)
+        my_third_room = BaseNetStackRoom(ROOM_PATH, cache_mb=_cache_mb)
+        my_third_room.get()
+        do_assert(len(my_third_room.get().xtrain), my_room.manifest['train'][1]['size'][0], LowLevelError.shard_cache)
+
+        # Sampler coverage: every row of the train datasets once per epoch, from mapped and from streamed shards.
+        _rows = sum(shard['size'][0] for shard in my_room.manifest['train'])
+        my_sampler = my_room.sampler(seed=0)
+        do_assert(my_sampler.mappable, True, LowLevelError.shard_sampler)
+        for _ in range(2):
+            _seen = np.concatenate([xbatch for xbatch, _ in my_sampler])
+            do_assert(len(_seen), _rows, LowLevelError.shard_sampler)
+            do_assert(len(set(map(tuple, _seen))), _rows, LowLevelError.shard_sampler)
+        my_db = BaseNetDatabase.load(f'{ROOM_PATH}/{my_room.manifest["train"][0]["file"]}')
+        do_assert(my_db.gather('train', [5, 1])[0].tolist(), my_db.xtrain[[1, 5]].tolist(), LowLevelError.shard_sampler)
+        for shard in my_room.manifest['train']:
+            BaseNetDatabase.load(f'{ROOM_PATH}/{shard["file"]}').save(f'{ROOM_PATH}/{shard["file"]}', legacy=True)
+            shard['mappable'] = False
+        my_sampler = my_room.sampler(batch_size=16, buffer_size=40, seed=0)
+        do_assert(my_sampler.mappable, False, LowLevelError.shard_sampler)
+        _batches = list(my_sampler)
+        _seen = np.concatenate([xbatch for xbatch, _ in _batches])
+        do_assert(len(_batches), len(my_sampler), LowLevelError.shard_sampler)
+        do_assert(len(set(map(tuple, _seen))), _rows, LowLevelError.shard_sampler)
+    finally:
+        shutil.rmtree(ROOM_PATH, ignore_errors=True)
+# - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
+#                        END OF FILE                        #
+# - x - x - x - x - x - x - x - x - x - x - x - x - x - x - #
@@ -33,6 +33,29 @@ _ERRORS = \
         'E018': 'Error in the BaseNetDatabase, database operations: merge (E018)',
         'E019': 'Error in the BaseNetDatabase, specified construction (E019)',
         'E020': 'Error in the BaseNetDatabase, automatic batch size (E020)',
+        'E021': 'Error in the BaseNetDatabase, seeded split (E021)',
+        'E022': 'Error in the BaseNetDatabase, memory-mapped importing (E022)',
+        'E023': 'Error in the BaseNetDatabase, header inspection (E023)',
+        'E024': 'Error in the BaseNetDatabase, k-fold views (E024)',
+        'E025': 'Error in the BaseNetDatabase, label encoding (E025)',
+        'E026': 'Error in the BaseNetDatabase, output mapping (E026)',
+        'E027': 'Error in the BaseNetDatabase, construction from a stream (E027)',
+        'E028': 'Error in the BaseNetDatabase, compact storage (E028)',
+        'E029': 'Error in the BaseNetDatabase, batch iteration (E029)',
+        'E030': 'Error in the BaseNetDatabase, incremental append (E030)',
+        'E031': 'Error in the BaseNetDatabase, content fingerprint (E031)',
+        'E032': 'Error in the BaseNetDatabase, dataset statistics (E032)',
+        'E033': 'Error in the BaseNetDatabase, stratified split (E033)',
+        'E034': 'Error in the BaseNetDatabase, class-balanced sampler (E034)',
+        'E035': 'Error in the BaseNetDatabase, parallel importing (E035)',
+        'E036': 'Error in the BaseNetDatabase, sparse inputs (E036)',
+        'E037': 'Error in the BaseNetDatabase, ragged sequences (E037)',
+        'E038': 'Error in the BaseNetDatabase, batch augmentation (E038)',
+        'E039': 'Error in the BaseNetDatabase, feature normalization (E039)',
+        'E040': 'Error in the BaseNetStackRoom, manifest lookup (E040)',
+        'E041': 'Error in the BaseNetStackRoom, shard prefetching (E041)',
+        'E042': 'Error in the BaseNetStackRoom, shuffled shard sampler (E042)',
+        'E043': 'Error in the BaseNetStackRoom, shard cache (E043)',
 
         # BaseNetCompiler:
     }
@@ -106,6 +129,30 @@ class LowLevelError:
     merge: int = 18
     explicit: int = 19
     auto_batch: int = 20
+    seeded_split: int = 21
+    mmap_importing: int = 22
+    inspection: int = 23
+    kfold: int = 24
+    label_encoding: int = 25
+    mapping: int = 26
+    construction_stream: int = 27
+    compact: int = 28
+    batches: int = 29
+    append: int = 30
+    fingerprint: int = 31
+    statistics: int = 32
+    stratified_split: int = 33
+    sampler: int = 34
+    parallel_importing: int = 35
+    sparse_inputs: int = 36
+    ragged: int = 37
+    augmentation: int = 38
+    normalization: int = 39
+    # BaseNetStackRoom:
+    manifest: int = 40
+    prefetch: int = 41
+    shard_sampler: int = 42
+    shard_cache: int = 43
     # BaseNetCompiler:
 
 
@@ -12,7 +12,8 @@ from test_wrapper import basenet_test
 from messages import TopLevelMessages, ErrorMessages
 from basenet import __version__
 
-from deeplearning import basenet_database_test, basenet_compiler_test, basenet_model_test, basenet_feeder_test
+from deeplearning import basenet_database_test, basenet_compiler_test, basenet_model_test, basenet_feeder_test, \
+    basenet_stackroom_test
 
 LOG_PATH = './testing.log'
 LOG_FORMAT = '[%(asctime)s:{%(funcName)14s:%(lineno)4d}:%(levelname)s] - %(message)s'
@@ -101,6 +102,8 @@ def run_tests(*args):
                                     timeout=5, timer=30) else 1
         errors += 0 if basenet_test(logger, preamble=TopLevelMessages.dl_inner, test=basenet_feeder_test,
                                     timeout=5, timer=10) else 1
+        errors += 0 if basenet_test(logger, preamble=TopLevelMessages.dl_inner, test=basenet_stackroom_test,
+                                    timeout=5, timer=30) else 1
         logger.info(TopLevelMessages.deeplearning_finish)
 
     if '--metaheuristic' in args or '--all' in args: